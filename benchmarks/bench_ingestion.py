@@ -0,0 +1,61 @@
+"""Benchmark : sniffing + vitesse de parsing (pandas vs pyarrow) sur des CSV synthétiques.
+
+Usage : python -m benchmarks.bench_ingestion [nb_lignes]
+"""
+import sys
+import time
+
+import numpy as np
+
+from dataviz_backend.ingestion import ENGINES, decode_csv, read_csv, sniff_csv
+from dataviz_backend.compaction import HAS_PYARROW
+
+FORMATS = {
+    # nom : (séparateur, décimale, encodage)
+    "standard": (",", ".", "utf-8"),
+    "europeen": (";", ",", "cp1252"),
+    "tabulation": ("\t", ".", "utf-8"),
+}
+
+
+def _synthetic_csv(n_rows: int, delimiter: str, decimal: str) -> str:
+    rng = np.random.default_rng(42)
+    dates = np.datetime64("2024-01-01") + rng.integers(0, 365, n_rows)
+    regions = np.array(["Île-de-France", "Nord", "Sud", "Bretagne", "Alsace"])[rng.integers(0, 5, n_rows)]
+    amounts = np.round(rng.normal(100, 25, n_rows), 2).astype(str)
+    quantities = rng.integers(1, 500, n_rows).astype(str)
+    if decimal == ",":
+        amounts = np.char.replace(amounts, ".", ",")
+
+    header = delimiter.join(["date", "region", "montant", "quantite"])
+    rows = (delimiter.join(r) for r in zip(dates.astype(str), regions, amounts, quantities))
+    return header + "\n" + "\n".join(rows) + "\n"
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    engines = [e for e in ENGINES if e != "pyarrow" or HAS_PYARROW]
+
+    for name, (delimiter, decimal, encoding) in FORMATS.items():
+        raw = _synthetic_csv(n_rows, delimiter, decimal).encode(encoding)
+        (text, detected), t_decode = _timed(decode_csv, raw)
+        dialect, t_sniff = _timed(sniff_csv, text)
+
+        ok = (detected == encoding, dialect["delimiter"] == delimiter, dialect["decimal"] == decimal)
+        print(f"[{name}] {len(raw) / 1e6:.1f} Mo | decode {t_decode * 1000:.1f} ms | "
+              f"sniff {t_sniff * 1000:.1f} ms -> {dialect} | correct={all(ok)}")
+
+        for engine in engines:
+            df, t_parse = _timed(read_csv, text, dialect, engine)
+            print(f"    {engine:>8} : {t_parse:.3f}s ({n_rows / t_parse / 1e6:.2f} M lignes/s), "
+                  f"{len(df.columns)} colonnes, dtypes={dict(df.dtypes.astype(str))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Benchmark : projection de colonnes sur un CSV large (lecture complète vs colonnes du graphique).
+
+Usage : python -m benchmarks.bench_projection [nb_lignes] [nb_colonnes]
+"""
+import sys
+import time
+
+import numpy as np
+
+from dataviz_backend.compaction import HAS_PYARROW, memory_usage_bytes
+from dataviz_backend.ingestion import ENGINES, read_csv, sniff_csv
+from dataviz_backend.projection import chart_columns
+
+
+def _wide_csv(n_rows: int, n_cols: int) -> str:
+    rng = np.random.default_rng(42)
+    regions = np.array(["Nord", "Sud", "Est", "Ouest"])[rng.integers(0, 4, n_rows)]
+    columns = [regions] + [np.round(rng.normal(100, 25, n_rows), 2).astype(str) for _ in range(n_cols - 1)]
+    header = ",".join(["region"] + [f"mesure_{i}" for i in range(1, n_cols)])
+    return header + "\n" + "\n".join(",".join(row) for row in zip(*columns)) + "\n"
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    n_cols = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    text = _wide_csv(n_rows, n_cols)
+    dialect = sniff_csv(text)
+
+    proposal = {"title": "Mesure par region", "chart_type": "bar", "variables": ["region", "mesure_1"]}
+    columns = chart_columns(proposal, dialect["columns"])
+    print(f"{n_rows} lignes x {n_cols} colonnes ({len(text) / 1e6:.1f} Mo), graphique sur {columns}")
+
+    for engine in [e for e in ENGINES if e != "pyarrow" or HAS_PYARROW]:
+        full, t_full = _timed(read_csv, text, dialect, engine)
+        projected, t_proj = _timed(read_csv, text, dialect, engine, usecols=columns)
+        m_full, m_proj = memory_usage_bytes(full), memory_usage_bytes(projected)
+        print(f"  {engine:>8} : lecture {t_full:.3f}s -> {t_proj:.3f}s (x{t_full / t_proj:.1f}), "
+              f"memoire {m_full / 2**20:.1f} Mo -> {m_proj / 2**20:.2f} Mo (x{m_full / m_proj:.0f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Benchmark : effet du prompt caching sur l'Agent 3 contre un serveur stub.
+
+Usage : python -m benchmarks.bench_prompt_cache [nb_requetes] [min_tokens_cache]
+
+Par défaut le stub applique le minimum de l'API pour claude-3-haiku (2048 tokens) :
+les prompts actuels sont trop courts et le cache n'a aucun effet. `min_tokens_cache=0`
+simule un préfixe assez long pour être mis en cache.
+"""
+import asyncio
+import sys
+import time
+
+import anthropic
+
+from dataviz_backend.agents import code_generator
+from dataviz_backend.agents.code_generator import CodeGeneratorAgent
+from dataviz_backend.code_library import CodeLibrary
+from dataviz_backend.llm import llm_metrics
+from benchmarks.stub_server import MIN_CACHEABLE_TOKENS, StubAnthropicServer
+
+CSV_DATA = "categorie,valeur\n" + "\n".join(f"c{i % 12},{i}" for i in range(500))
+PROPOSAL = {"title": "Valeur par categorie", "chart_type": "bar", "variables": ["categorie", "valeur"]}
+
+
+class _NoReuseLibrary(CodeLibrary):
+    """Aucun candidat : chaque requête appelle le LLM (c'est le cache de prompt qui est mesuré)"""
+
+    def candidates(self, signature: str) -> list:
+        return []
+
+
+def _uncached_system(text: str) -> list:
+    return [{"type": "text", "text": text}]
+
+
+async def _run(n_requests: int, use_cache: bool, min_tokens: int) -> dict:
+    original = code_generator.cached_system
+    if not use_cache:
+        code_generator.cached_system = _uncached_system
+
+    llm_metrics.reset()
+    try:
+        with StubAnthropicServer(min_cacheable_tokens=min_tokens) as stub:
+            agent = CodeGeneratorAgent()
+            agent.client = anthropic.Anthropic(base_url=stub.base_url, api_key="stub")
+            agent.library = _NoReuseLibrary()
+
+            start = time.perf_counter()
+            for _ in range(n_requests):
+                await agent.generate_visualization(PROPOSAL, CSV_DATA)
+            elapsed = time.perf_counter() - start
+    finally:
+        code_generator.cached_system = original
+
+    total = llm_metrics.snapshot()["total"]
+    return {"seconds": elapsed, **total}
+
+
+def main():
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    min_tokens = int(sys.argv[2]) if len(sys.argv) > 2 else MIN_CACHEABLE_TOKENS
+    print(f"minimum cachable : {min_tokens} tokens")
+    for label, use_cache in (("sans cache", False), ("avec cache", True)):
+        r = asyncio.run(_run(n_requests, use_cache, min_tokens))
+        print(
+            f"{label:>11} : {r['seconds']:.2f}s pour {n_requests} requetes | "
+            f"input={r['input_tokens']} cache_write={r['cache_creation_input_tokens']} "
+            f"cache_read={r['cache_read_input_tokens']} hit_ratio={r['cache_hit_ratio']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Serveur HTTP minimal qui imite l'API Messages d'Anthropic pour les benchmarks.
+
+- Les tokens sont estimés à ~4 caractères par token.
+- Les blocs `system` marqués `cache_control` sont mis en cache : le 1er appel
+  compte des tokens d'écriture, les suivants des tokens de lecture.
+- Comme l'API, un préfixe plus court que `min_cacheable_tokens` (2048 pour les
+  modèles Haiku) n'est pas mis en cache : il est facturé en tokens d'entrée normaux.
+- La latence simulée est proportionnelle aux tokens d'entrée NON cachés,
+  ce qui approxime le temps de pré-remplissage (time-to-first-token).
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHARS_PER_TOKEN = 4
+SECONDS_PER_UNCACHED_TOKEN = 0.0002
+SECONDS_PER_CACHED_TOKEN = 0.00002
+MIN_CACHEABLE_TOKENS = 2048  # Minimum de l'API pour claude-3-haiku (1024 pour Sonnet/Opus)
+
+DEFAULT_REPLY = (
+    "sns.set_style('whitegrid')\n"
+    "plt.figure(figsize=(12, 7))\n"
+    "agg = df.groupby(df.columns[0])[df.select_dtypes('number').columns[0]].sum()\n"
+    "plt.bar(agg.index.astype(str), agg.values)\n"
+    "plt.title('Stub', fontsize=16, fontweight='bold')\n"
+    "plt.tight_layout()"
+)
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _content_text(content) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content)
+
+
+class StubAnthropicServer:
+    """Lance le stub dans un thread ; utilisable comme context manager"""
+
+    def __init__(self, reply: str = DEFAULT_REPLY, min_cacheable_tokens: int = MIN_CACHEABLE_TOKENS):
+        self.reply = reply
+        self.min_cacheable_tokens = min_cacheable_tokens
+        self.cache = set()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def _usage(self, body: dict) -> dict:
+        system = body.get("system") or []
+        if isinstance(system, str):
+            system = [{"type": "text", "text": system}]
+
+        cached_text, uncached_text = "", ""
+        for block in system:
+            if block.get("cache_control"):
+                cached_text += block["text"]
+            else:
+                uncached_text += block.get("text", "")
+        if cached_text and _tokens(cached_text) < self.min_cacheable_tokens:
+            uncached_text, cached_text = cached_text + uncached_text, ""
+        uncached_text += "".join(_content_text(m["content"]) for m in body.get("messages", []))
+
+        usage = {
+            "input_tokens": _tokens(uncached_text),
+            "output_tokens": _tokens(self.reply),
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0,
+        }
+        if cached_text:
+            with self.lock:
+                hit = cached_text in self.cache
+                self.cache.add(cached_text)
+            key = "cache_read_input_tokens" if hit else "cache_creation_input_tokens"
+            usage[key] = _tokens(cached_text)
+        return usage
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("content-length", 0))
+                body = json.loads(self.rfile.read(length))
+                usage = stub._usage(body)
+
+                time.sleep(
+                    (usage["input_tokens"] + usage["cache_creation_input_tokens"]) * SECONDS_PER_UNCACHED_TOKEN
+                    + usage["cache_read_input_tokens"] * SECONDS_PER_CACHED_TOKEN
+                )
+
+                payload = json.dumps({
+                    "id": "msg_stub",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": body.get("model", "stub"),
+                    "content": [{"type": "text", "text": stub.reply}],
+                    "stop_reason": "end_turn",
+                    "stop_sequence": None,
+                    "usage": usage,
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
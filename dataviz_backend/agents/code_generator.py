@@ -1,23 +1,60 @@
 import anthropic
 import pandas as pd
-from io import StringIO, BytesIO
+from io import BytesIO
 import matplotlib
 matplotlib.use('Agg')  # Backend sans GUI pour le serveur
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 import base64
-import gc
+import re
+import traceback
+from ..llm import DeadlineExceeded, cached_system, hedged_create, llm_latency, llm_metrics
+from ..code_library import CodeLibrary, retitle, schema_signature
+from ..compaction import compact_dataframe, widen_for_exec
+from ..ingestion import read_csv
 
 
 class CodeGeneratorAgent:
     """Agent 3 : Génère le code matplotlib via LLM et retourne l'image"""
 
     MAX_ROWS_VIZ = 10000  # Echantillonner si plus de 10000 lignes
+    CODE_FILENAME = "<generated>"  # Nom de fichier pour localiser les erreurs dans le code genere
+
+    PATCH_PATTERN = re.compile(
+        r"<<<<<<< SEARCH\n(.*?)\n?=======\n(.*?)\n?>>>>>>> REPLACE",
+        re.DOTALL
+    )
+
+    # Préfixe stable (identique pour toutes les requêtes) -> mis en cache côté fournisseur
+    SYSTEM_PROMPT = """Tu es un expert Python en data visualization avec matplotlib et seaborn.
+Tu génères du code Python pour créer la visualisation demandée.
+
+RÈGLES OBLIGATOIRES :
+1. Le DataFrame s'appelle 'df'. Il est déjà chargé.
+2. matplotlib.pyplot est importé comme 'plt', seaborn comme 'sns', numpy comme 'np'.
+3. Commence par plt.figure(figsize=(12, 7))
+4. AGRÈGE les données si nécessaire (groupby, value_counts) AVANT de tracer.
+5. Pour un pie chart : limite à 8 catégories max (regroupe le reste dans "Autre").
+6. Pour un bar chart : trie par valeur décroissante, limite à 15 barres max.
+7. Pour un scatter avec beaucoup de points : utilise alpha=0.5.
+8. Titre lisible avec plt.title(..., fontsize=16, fontweight='bold')
+9. Labels d'axes avec plt.xlabel/plt.ylabel(..., fontsize=13)
+10. plt.tight_layout() à la fin.
+11. Si les labels x sont longs, utilise plt.xticks(rotation=45, ha='right')
+12. Utilise sns.set_style('whitegrid') au début.
+13. NE PAS appeler plt.show() ni plt.savefig().
+14. NE PAS créer de nouveau DataFrame à partir de zéro, utilise 'df'.
+15. Vérifie que les colonnes utilisées EXISTENT dans la liste des colonnes fournie.
+16. Les colonnes catégorielles peuvent être de type 'category' : passe observed=True à groupby.
+
+Réponds UNIQUEMENT avec du code Python exécutable.
+PAS de ```python, PAS de texte explicatif, PAS de markdown. Juste le code."""
 
     def __init__(self):
         self.client = anthropic.Anthropic()
         self.model = "claude-3-haiku-20240307"
+        self.library = CodeLibrary.from_env()
 
     def _clean_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
         """Nettoie le DataFrame"""
@@ -26,10 +63,10 @@ class CodeGeneratorAgent:
             df = df.drop(columns=unnamed_cols)
         return df
 
-    def _build_prompt(self, proposal: dict, df: pd.DataFrame, error_msg: str = None) -> str:
+    def _build_prompt(self, proposal: dict, df: pd.DataFrame) -> str:
         """Construit le prompt pour générer du code matplotlib"""
         numeric_cols = df.select_dtypes(include='number').columns.tolist()
-        categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
+        categorical_cols = df.select_dtypes(include=['object', 'category', 'string']).columns.tolist()
 
         variables = proposal.get('variables', [])
         valid_vars = [v for v in variables if v in df.columns]
@@ -39,12 +76,7 @@ class CodeGeneratorAgent:
         if invalid_vars:
             vars_warning = f"\nATTENTION : Ces colonnes N'EXISTENT PAS : {invalid_vars}. Utilise seulement les colonnes listées ci-dessous."
 
-        retry_info = ""
-        if error_msg:
-            retry_info = f"\nTA TENTATIVE PRÉCÉDENTE A ÉCHOUÉ AVEC : {error_msg}\nCorrige le code pour éviter cette erreur.\n"
-
-        prompt = f"""Tu es un expert Python en data visualization avec matplotlib et seaborn.
-Génère du code Python pour créer cette visualisation.
+        prompt = f"""Génère le code de cette visualisation.
 
 VISUALISATION :
 - Titre : {proposal['title']}
@@ -59,29 +91,76 @@ DONNÉES :
 - Nombre de lignes : {len(df)}
 - Aperçu :
 {df.head(8).to_string()}
-{retry_info}
-RÈGLES OBLIGATOIRES :
-1. Le DataFrame s'appelle 'df'. Il est déjà chargé.
-2. matplotlib.pyplot est importé comme 'plt', seaborn comme 'sns', numpy comme 'np'.
-3. Commence par plt.figure(figsize=(12, 7))
-4. AGRÈGE les données si nécessaire (groupby, value_counts) AVANT de tracer.
-5. Pour un pie chart : limite à 8 catégories max (regroupe le reste dans "Autre").
-6. Pour un bar chart : trie par valeur décroissante, limite à 15 barres max.
-7. Pour un scatter avec beaucoup de points : utilise alpha=0.5.
-8. Titre lisible avec plt.title(..., fontsize=16, fontweight='bold')
-9. Labels d'axes avec plt.xlabel/plt.ylabel(..., fontsize=13)
-10. plt.tight_layout() à la fin.
-11. Si les labels x sont longs, utilise plt.xticks(rotation=45, ha='right')
-12. Utilise sns.set_style('whitegrid') au début.
-13. NE PAS appeler plt.show() ni plt.savefig().
-14. NE PAS créer de nouveau DataFrame à partir de zéro, utilise 'df'.
-15. Vérifie que les colonnes utilisées EXISTENT dans {list(df.columns)}.
-
-Réponds UNIQUEMENT avec du code Python exécutable.
-PAS de ```python, PAS de texte explicatif, PAS de markdown. Juste le code."""
+"""
 
         return prompt
 
+    def _describe_error(self, error: Exception, code: str, df: pd.DataFrame) -> dict:
+        """Extrait une erreur structurée (type, ligne, colonne fautive)"""
+        line_no = getattr(error, 'lineno', None) if isinstance(error, SyntaxError) else None
+        if line_no is None:
+            for frame in reversed(traceback.extract_tb(error.__traceback__)):
+                if frame.filename == self.CODE_FILENAME:
+                    line_no = frame.lineno
+                    break
+
+        code_lines = code.split('\n')
+        line_code = code_lines[line_no - 1].strip() if line_no and 0 < line_no <= len(code_lines) else None
+
+        column = None
+        if isinstance(error, KeyError) and error.args:
+            candidate = str(error.args[0])
+            if candidate not in df.columns:
+                column = candidate
+
+        return {
+            "type": type(error).__name__,
+            "message": str(error),
+            "line": line_no,
+            "line_code": line_code,
+            "column": column
+        }
+
+    def _build_repair_prompt(self, error_info: dict, df: pd.DataFrame) -> str:
+        """Construit le message de réparation (suite de la conversation)"""
+        details = [f"- Type : {error_info['type']}", f"- Message : {error_info['message']}"]
+        if error_info.get('line'):
+            details.append(f"- Ligne {error_info['line']} : {error_info.get('line_code') or ''}")
+        if error_info.get('column'):
+            details.append(f"- Colonne inexistante : {error_info['column']!r}")
+
+        details_text = '\n'.join(details)
+
+        return f"""Ton code a échoué à l'exécution.
+
+ERREUR :
+{details_text}
+
+Colonnes disponibles : {list(df.columns)}
+
+Corrige le code avec un patch MINIMAL. Pour chaque modification, utilise exactement ce format :
+<<<<<<< SEARCH
+lignes exactes du code actuel
+=======
+lignes corrigées
+>>>>>>> REPLACE
+
+Réponds UNIQUEMENT avec les blocs de patch, sans texte explicatif."""
+
+    def _apply_patch(self, code: str, patch: str) -> str:
+        """Applique des blocs SEARCH/REPLACE sur le code précédent"""
+        blocks = self.PATCH_PATTERN.findall(patch)
+        if not blocks:
+            # Le modèle a renvoyé un programme complet au lieu d'un patch
+            return self._clean_code(patch)
+
+        for search, replace in blocks:
+            if search not in code:
+                raise ValueError(f"Patch inapplicable, bloc introuvable : {search[:80]!r}")
+            code = code.replace(search, replace, 1)
+
+        return self._clean_code(code)
+
     def _clean_code(self, code: str) -> str:
         """Nettoie le code généré"""
         if "```python" in code:
@@ -115,7 +194,7 @@ PAS de ```python, PAS de texte explicatif, PAS de markdown. Juste le code."""
             "pd": pd
         }
 
-        exec(code, local_scope)
+        exec(compile(code, self.CODE_FILENAME, 'exec'), local_scope)
 
         # Capturer la figure courante
         fig = plt.gcf()
@@ -137,65 +216,136 @@ PAS de ```python, PAS de texte explicatif, PAS de markdown. Juste le code."""
 
         return img_base64
 
-    async def generate_visualization(self, proposal: dict, csv_data: str) -> dict:
-        """Génère la visualisation matplotlib via LLM avec retry"""
-        df = pd.read_csv(StringIO(csv_data))
+    def _prepare_dataframe(self, df: pd.DataFrame) -> tuple:
+        """Nettoyage + compaction + échantillonnage + types larges pour exec. Retourne (df, rapport mémoire)"""
         df = self._clean_dataframe(df)
+        # Compacter AVANT d'echantillonner : la copie faite par sample() est deja compacte
+        df, memory_report = compact_dataframe(df)
 
         # Echantillonner si le dataset est trop gros (economie memoire)
         if len(df) > self.MAX_ROWS_VIZ:
             df = df.sample(self.MAX_ROWS_VIZ, random_state=42)
 
+        # Élargir seulement l'échantillon : la conversion porte sur au plus MAX_ROWS_VIZ lignes
+        return widen_for_exec(df), memory_report
+
+    def rerender(self, code: str, df: pd.DataFrame) -> dict:
+        """Ré-exécute un code déjà validé sur de nouvelles données, sans appel LLM"""
+        df, memory_report = self._prepare_dataframe(df)
+        img_base64 = self._execute_and_capture(code, df)
+        return {
+            "image_base64": img_base64,
+            "code": code,
+            "memory": memory_report
+        }
+
+    async def generate_visualization(self, proposal: dict, csv_data: str, deadline=None) -> dict:
+        """Génère la visualisation matplotlib via LLM avec retry"""
+        return await self.generate_from_dataframe(proposal, read_csv(csv_data), deadline)
+
+    async def generate_from_dataframe(self, proposal: dict, df: pd.DataFrame, deadline=None) -> dict:
+        """
+        Génère la visualisation à partir d'un DataFrame déjà chargé.
+        Le code déjà validé sur un schéma identique est essayé en premier (aucun appel LLM).
+        Une tentative LLM n'est lancée que si l'échéance peut la couvrir ; sinon fallback direct.
+        """
+        df, memory_report = self._prepare_dataframe(df)
+
+        signature = schema_signature(df, proposal)
+        reused = self._run_from_library(signature, proposal, df)
+        if reused is not None:
+            code, img_base64 = reused
+            return {
+                "image_base64": img_base64,
+                "code": code,
+                "memory": memory_report,
+                "reused": True
+            }
+
         max_retries = 3
         last_error = None
         last_code = ""
+        messages = [{"role": "user", "content": self._build_prompt(proposal, df)}]
 
         for attempt in range(max_retries):
-            error_msg = str(last_error) if last_error else None
-            prompt = self._build_prompt(proposal, df, error_msg)
-
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=2048,
-                messages=[{"role": "user", "content": prompt}]
-            )
-
-            code = self._clean_code(response.content[0].text.strip())
-            last_code = code
+            try:
+                if deadline is not None and not deadline.allows(llm_latency.expected("code_generator")):
+                    raise DeadlineExceeded("budget insuffisant pour une nouvelle tentative")
+                response = await hedged_create(
+                    self.client, "code_generator", deadline,
+                    model=self.model,
+                    max_tokens=2048,
+                    system=cached_system(self.SYSTEM_PROMPT),
+                    messages=messages
+                )
+            except DeadlineExceeded as e:
+                llm_metrics.count("code_generator", "deadline_fallbacks")
+                last_error = e
+                break
+            response_text = response.content[0].text.strip()
 
             try:
+                if attempt == 0:
+                    code = self._clean_code(response_text)
+                else:
+                    # Mode réparation : patch appliqué localement sur le dernier code
+                    code = self._apply_patch(last_code, response_text)
+                last_code = code
                 img_base64 = self._execute_and_capture(code, df)
+                self.library.record_success(signature, code, proposal.get('title', ''))
                 del df
-                gc.collect()
 
                 return {
                     "image_base64": img_base64,
-                    "code": code
+                    "code": code,
+                    "memory": memory_report
                 }
 
             except Exception as e:
                 last_error = e
                 plt.close('all')
+                error_info = self._describe_error(e, last_code, df)
+                # On continue la conversation : code précédent + erreur structurée
+                messages = messages[:1] + [
+                    {"role": "assistant", "content": last_code},
+                    {"role": "user", "content": self._build_repair_prompt(error_info, df)}
+                ]
                 continue
 
-        # Toutes les tentatives ont échoué -> fallback déterministe
+        # Toutes les tentatives ont échoué (ou plus de budget de temps) -> fallback déterministe
         plt.close('all')
         img_base64 = self._build_fallback(proposal, df)
         del df
-        gc.collect()
 
         return {
             "image_base64": img_base64,
-            "code": f"# Fallback (erreur LLM : {str(last_error)})\n{last_code}"
+            "code": f"# Fallback (erreur LLM : {str(last_error)})\n{last_code}",
+            "memory": memory_report,
+            "degraded": isinstance(last_error, DeadlineExceeded)
         }
 
+    def _run_from_library(self, signature: str, proposal: dict, df: pd.DataFrame):
+        """Exécute le code connu pour ce schéma. Retourne (code, image) ou None"""
+        for entry in self.library.candidates(signature):
+            code = retitle(entry["code"], entry["title"], proposal.get('title', ''))
+            try:
+                img_base64 = self._execute_and_capture(code, df)
+            except Exception:
+                plt.close('all')
+                self.library.record_failure(signature, entry["code"])
+                continue
+            self.library.record_hit()
+            self.library.record_success(signature, entry["code"], entry["title"])
+            return code, img_base64
+        return None
+
     def _build_fallback(self, proposal: dict, df: pd.DataFrame) -> str:
         """Construit un graphique fallback déterministe et retourne le base64"""
         chart_type = proposal.get('chart_type', 'bar').lower()
         title = proposal.get('title', 'Visualisation')
 
         numeric_cols = df.select_dtypes(include='number').columns.tolist()
-        categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
+        categorical_cols = df.select_dtypes(include=['object', 'category', 'string']).columns.tolist()
 
         x_col = categorical_cols[0] if categorical_cols else None
         y_col = numeric_cols[0] if numeric_cols else None
@@ -204,7 +354,7 @@ PAS de ```python, PAS de texte explicatif, PAS de markdown. Juste le code."""
         plt.figure(figsize=(12, 7))
 
         if chart_type == 'pie' and x_col and y_col:
-            agg = df.groupby(x_col)[y_col].sum().sort_values(ascending=False)
+            agg = df.groupby(x_col, observed=True)[y_col].sum().sort_values(ascending=False)
             if len(agg) > 8:
                 top = agg.head(7)
                 top['Autre'] = agg.iloc[7:].sum()
@@ -212,14 +362,20 @@ PAS de ```python, PAS de texte explicatif, PAS de markdown. Juste le code."""
             plt.pie(agg.values, labels=agg.index, autopct='%1.1f%%', startangle=90)
 
         elif chart_type == 'scatter' and len(numeric_cols) >= 2:
-            plot_df = df if len(df) <= 1000 else df.sample(1000, random_state=42)
-            plt.scatter(plot_df[numeric_cols[0]], plot_df[numeric_cols[1]], alpha=0.5)
+            if len(df) <= 1000:
+                plt.scatter(df[numeric_cols[0]], df[numeric_cols[1]], alpha=0.5)
+            else:
+                # Densite binnee sur toutes les lignes plutot qu'un sous-echantillon de points
+                plt.hexbin(df[numeric_cols[0]], df[numeric_cols[1]], gridsize=60, bins='log', mincnt=1)
+                plt.colorbar(label='Nombre de points')
             plt.xlabel(numeric_cols[0].replace('_', ' ').title(), fontsize=13)
             plt.ylabel(numeric_cols[1].replace('_', ' ').title(), fontsize=13)
 
         elif chart_type == 'box' and x_col and y_col:
             top_cats = df[x_col].value_counts().head(10).index
             plot_df = df[df[x_col].isin(top_cats)]
+            if isinstance(plot_df[x_col].dtype, pd.CategoricalDtype):
+                plot_df = plot_df.assign(**{x_col: plot_df[x_col].cat.remove_unused_categories()})
             sns.boxplot(data=plot_df, x=x_col, y=y_col)
             plt.xticks(rotation=45, ha='right')
 
@@ -228,7 +384,7 @@ PAS de ```python, PAS de texte explicatif, PAS de markdown. Juste le code."""
             plt.xlabel(y_col.replace('_', ' ').title(), fontsize=13)
 
         elif x_col and y_col:
-            agg = df.groupby(x_col)[y_col].sum().sort_values(ascending=False).head(15)
+            agg = df.groupby(x_col, observed=True)[y_col].sum().sort_values(ascending=False).head(15)
             plt.barh(agg.index, agg.values)
             plt.xlabel(y_col.replace('_', ' ').title(), fontsize=13)
 
@@ -1,42 +1,70 @@
 import pandas as pd
 import anthropic
-from io import StringIO
 import json
-import gc
+from ..llm import DeadlineExceeded, cached_system, hedged_create, llm_latency, llm_metrics
+from ..compaction import compact_dataframe
+from ..ingestion import read_csv
 
 class DataAnalystAgent:
     """Agent 1 : Analyse les données et comprend la problématique"""
 
     MAX_ROWS_ANALYSIS = 5000  # Echantillonner si plus de 5000 lignes
+    MAX_NUMERIC_STATS = 10  # Colonnes numériques profilées (statistiques)
+    MAX_CORR_COLUMNS = 8  # ... dont celles de la matrice de corrélation
+
+    # Préfixe stable (identique pour toutes les requêtes) -> mis en cache côté fournisseur
+    SYSTEM_PROMPT = """Tu es un data analyst expert. Analyse le dataset et la problématique fournis.
+
+Fournis une analyse structurée en JSON avec cette structure exacte :
+{
+    "insights": "Description des patterns clés, valeurs manquantes, distributions importantes",
+    "relevant_columns": ["colonne1", "colonne2"],
+    "recommended_approach": "Approche analytique recommandée pour répondre à la problématique"
+}
+
+Réponds UNIQUEMENT avec le JSON, sans texte avant ou après."""
 
     def __init__(self):
         self.client = anthropic.Anthropic()
         self.model = "claude-3-haiku-20240307"
 
-    async def analyze(self, csv_data: str, problem: str) -> dict:
+    async def analyze(self, csv_data: str, problem: str, deadline=None) -> dict:
         """
         Analyse le dataset et retourne un résumé structuré
         """
         # Parse CSV
-        df = pd.read_csv(StringIO(csv_data))
-        total_rows = len(df)
+        return await self.analyze_dataframe(read_csv(csv_data), problem, deadline)
 
-        # Echantillonner si trop gros (economie de memoire)
-        if total_rows > self.MAX_ROWS_ANALYSIS:
-            df = df.sample(self.MAX_ROWS_ANALYSIS, random_state=42)
+    async def analyze_dataframe(self, df: pd.DataFrame, problem: str, deadline=None) -> dict:
+        """
+        Analyse un DataFrame déjà chargé (le DataFrame d'origine n'est pas modifié).
+        Si l'échéance ne laisse pas le temps d'un appel LLM, seules les statistiques sont calculées.
+        """
+        total_rows = len(df)
 
         # Supprimer les colonnes Unnamed
         unnamed_cols = [c for c in df.columns if 'Unnamed' in str(c)]
         if unnamed_cols:
             df = df.drop(columns=unnamed_cols)
 
-        # Statistiques de base - SEULEMENT sur colonnes numériques
-        numeric_cols = df.select_dtypes(include='number')
+        # Projection : seules les colonnes profilées (10 premières numériques) sont
+        # échantillonnées et compactées ; les autres ne servent qu'aux types et à l'aperçu
+        profiled = df.select_dtypes(include='number').columns[:self.MAX_NUMERIC_STATS].tolist()
         column_types = df.dtypes.astype(str).to_dict()
+        preview = df.head(5)
+        numeric_cols = df[profiled]
+
+        # Echantillonner si trop gros (economie de memoire)
+        if total_rows > self.MAX_ROWS_ANALYSIS:
+            numeric_cols = numeric_cols.sample(self.MAX_ROWS_ANALYSIS, random_state=42)
+
+        # Types compacts (int32/float32 sans perte) : ces colonnes ne servent qu'aux stats
+        numeric_cols, memory_report = compact_dataframe(numeric_cols, compact_ints=True)
+        column_types.update(numeric_cols.dtypes.astype(str).to_dict())
 
         # Stats simplifiees (pas tout describe() qui est lourd)
         numeric_stats = {}
-        for col in numeric_cols.columns[:10]:  # Max 10 colonnes
+        for col in profiled:
             numeric_stats[col] = {
                 "mean": round(float(numeric_cols[col].mean()), 2),
                 "min": round(float(numeric_cols[col].min()), 2),
@@ -45,7 +73,7 @@ class DataAnalystAgent:
 
         # Corrélations - limiter aux 8 premieres colonnes numeriques
         correlations = None
-        num_cols_list = numeric_cols.columns.tolist()[:8]
+        num_cols_list = profiled[:self.MAX_CORR_COLUMNS]
         if len(num_cols_list) > 1:
             correlations = numeric_cols[num_cols_list].corr().round(2).to_dict()
 
@@ -56,42 +84,37 @@ Dataset Information:
 - Colonnes : {list(df.columns)}
 - Types : {column_types}
 - Premières lignes :
-{df.head(5).to_string()}
+{preview.to_string()}
 
 Problématique utilisateur : {problem}
 """
 
-        # Prompt pour Claude
-        prompt = f"""Tu es un data analyst expert. Analyse ce dataset et cette problématique.
-
-{context}
-
-Fournis une analyse structurée en JSON avec cette structure exacte :
-{{
-    "insights": "Description des patterns clés, valeurs manquantes, distributions importantes",
-    "relevant_columns": ["colonne1", "colonne2"],
-    "recommended_approach": "Approche analytique recommandée pour répondre à la problématique"
-}}
-
-Réponds UNIQUEMENT avec le JSON, sans texte avant ou après.
-"""
-
-        response = self.client.messages.create(
-            model=self.model,
-            max_tokens=1024,
-            messages=[{"role": "user", "content": prompt}]
-        )
-
-        response_text = response.content[0].text
-
         try:
-            analysis = json.loads(response_text.strip())
-        except json.JSONDecodeError:
-            analysis = {
-                "insights": response_text,
-                "relevant_columns": list(df.columns),
-                "recommended_approach": "Analyse exploratoire"
-            }
+            if deadline is not None and not deadline.allows(llm_latency.expected("data_analyst")):
+                raise DeadlineExceeded("data_analyst : budget insuffisant pour un appel LLM")
+            response = await hedged_create(
+                self.client, "data_analyst", deadline,
+                model=self.model,
+                max_tokens=1024,
+                system=cached_system(self.SYSTEM_PROMPT),
+                messages=[{"role": "user", "content": context}]
+            )
+            response_text = response.content[0].text
+        except DeadlineExceeded:
+            # Dégradation : les statistiques suffisent à l'Agent 2 (propositions heuristiques)
+            llm_metrics.count("data_analyst", "deadline_fallbacks")
+            response_text = None
+
+        analysis = {
+            "insights": response_text or "",
+            "relevant_columns": list(df.columns),
+            "recommended_approach": "Analyse exploratoire"
+        }
+        if response_text is not None:
+            try:
+                analysis = json.loads(response_text.strip())
+            except json.JSONDecodeError:
+                pass
 
         result = {
             "column_types": column_types,
@@ -99,11 +122,11 @@ Réponds UNIQUEMENT avec le JSON, sans texte avant ou après.
             "correlations": correlations,
             "insights": analysis.get("insights", ""),
             "relevant_columns": analysis.get("relevant_columns", []),
-            "recommended_approach": analysis.get("recommended_approach", "")
+            "recommended_approach": analysis.get("recommended_approach", ""),
+            "memory": memory_report
         }
 
         # Liberer la memoire
-        del df, numeric_cols
-        gc.collect()
+        del df, numeric_cols, preview
 
         return result
@@ -0,0 +1,291 @@
+"""Traitement par lots sans serveur HTTP : manifeste de (CSV, problématique) -> graphiques sur disque.
+
+Usage :
+    python -m dataviz_backend.batch manifest.csv --output sorties/ --workers 8 --llm-concurrency 32
+
+Chaque worker exécute plusieurs tâches à la fois (tâches asyncio, llm_concurrency / workers
+par processus) : les appels LLM en vol ne sont pas limités par le nombre de processus.
+
+Le manifeste est un CSV (ou JSONL) avec les colonnes `csv_path` et `problem`.
+La progression est enregistrée dans `<output>/progress.jsonl` : relancer la même
+commande reprend là où elle s'était arrêtée.
+"""
+import argparse
+import asyncio
+import base64
+import csv
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import queue
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from .ingestion import decode_csv
+from .llm import Deadline, track_usage
+from .orchestrator import MultiAgentOrchestrator
+
+PROGRESS_FILE = "progress.jsonl"
+
+# État propre à chaque processus worker
+_orchestrator = None
+
+
+def load_manifest(path: str) -> list:
+    """Lit le manifeste (CSV ou JSONL) et attribue un identifiant stable à chaque tâche"""
+    path = Path(path)
+    with open(path, encoding="utf-8") as f:
+        if path.suffix == ".jsonl":
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    jobs = []
+    for row in rows:
+        csv_path = str((path.parent / row["csv_path"]).resolve())
+        problem = row["problem"]
+        digest = hashlib.sha1(f"{csv_path}\0{problem}".encode("utf-8")).hexdigest()[:8]
+        stem = re.sub(r"[^A-Za-z0-9_-]+", "_", Path(csv_path).stem)
+        jobs.append({"job_id": f"{stem}-{digest}", "csv_path": csv_path, "problem": problem})
+    return jobs
+
+
+def load_completed(output_dir: Path) -> set:
+    """Identifiants des tâches déjà terminées avec succès (checkpoint)"""
+    progress = output_dir / PROGRESS_FILE
+    if not progress.exists():
+        return set()
+    with open(progress, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return {r["job_id"] for r in records if r.get("status") == "ok"}
+
+
+class _ThrottledMessages:
+    """Limite le nombre d'appels LLM simultanés, tous processus confondus"""
+
+    def __init__(self, messages, semaphore):
+        self._messages = messages
+        self._semaphore = semaphore
+
+    def create(self, **kwargs):
+        with self._semaphore:
+            return self._messages.create(**kwargs)
+
+
+def _split_budgets(orchestrator, workers: int) -> None:
+    """
+    Chaque worker a son propre orchestrateur : MEMORY_BUDGET_MB, DATASET_STORE_MB et
+    TILE_CACHE_MB sont des budgets de machine, partagés entre les processus.
+    """
+    workers = max(workers, 1)
+    orchestrator.memory.budget_bytes //= workers
+    orchestrator.datasets.max_bytes //= workers
+    orchestrator.tiles.max_bytes //= workers
+
+
+def _worker_init(semaphore, workers: int = 1) -> None:
+    global _orchestrator
+    load_dotenv()
+    _orchestrator = MultiAgentOrchestrator()
+    _split_budgets(_orchestrator, workers)
+    for agent in (_orchestrator.data_analyst, _orchestrator.viz_strategist, _orchestrator.code_generator):
+        agent.client.messages = _ThrottledMessages(agent.client.messages, semaphore)
+
+
+async def _process(job: dict, output_dir: Path, max_charts: int, render_mode: str) -> tuple:
+    """Retourne (graphiques écrits, graphiques dégradés)"""
+    # Pas d'échéance HTTP ni de duplication : l'attente du sémaphore LLM partagé
+    # ne doit pas faire basculer les graphiques sur le rendu de secours
+    deadline = Deadline(None, hedge=False)
+    with open(job["csv_path"], "rb") as f:
+        csv_data, _ = decode_csv(f.read())
+
+    job_dir = output_dir / job["job_id"]
+    job_dir.mkdir(parents=True, exist_ok=True)
+
+    result = await _orchestrator.get_proposals(job["problem"], csv_data, deadline=deadline)
+    try:
+        with open(job_dir / "summary.json", "w", encoding="utf-8") as f:
+            json.dump({"problem": job["problem"], "csv_path": job["csv_path"], **result}, f, ensure_ascii=False, indent=2, default=str)
+
+        charts = degraded = 0
+        for i, proposal in enumerate(result["proposals"][:max_charts], start=1):
+            viz = await _orchestrator.generate_viz(
+                proposal, csv_data, render_mode=render_mode, dataset_id=result.get("dataset_id"), deadline=deadline
+            )
+            degraded += bool(viz.get("degraded"))
+            if viz.get("image_base64"):
+                (job_dir / f"chart_{i}.png").write_bytes(base64.b64decode(viz["image_base64"]))
+            if viz.get("plotly_json"):
+                with open(job_dir / f"chart_{i}.plotly.json", "w", encoding="utf-8") as f:
+                    json.dump(viz["plotly_json"], f)
+            (job_dir / f"chart_{i}.py").write_text(viz.get("code", ""), encoding="utf-8")
+            charts += 1
+        return charts, degraded
+    finally:
+        # Personne ne fera d'append sur ce dataset : inutile de le garder pour les tâches suivantes
+        if result.get("dataset_id"):
+            _orchestrator.datasets.discard(result["dataset_id"])
+
+
+async def _run_job(job: dict, output_dir: str, max_charts: int, render_mode: str) -> dict:
+    """Exécute une tâche ; ne lève jamais (erreur -> status)"""
+    start = time.perf_counter()
+    record = {"job_id": job["job_id"], "csv_path": job["csv_path"]}
+    # Tokens comptés par tâche : d'autres tâches du même processus tournent en parallèle
+    with track_usage() as usage:
+        try:
+            record["charts"], degraded = await _process(job, Path(output_dir), max_charts, render_mode)
+            # Graphique de secours : la tâche n'est pas marquée terminée, une reprise la relance
+            record["status"] = "degraded" if degraded else "ok"
+            if degraded:
+                record["degraded_charts"] = degraded
+        except Exception as e:
+            record["charts"] = 0
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {e}"
+
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    record["input_tokens"] = usage["input_tokens"]
+    record["output_tokens"] = usage["output_tokens"]
+    return record
+
+
+def run_job(job: dict, output_dir: str, max_charts: int, render_mode: str) -> dict:
+    """Exécute une seule tâche dans le processus courant"""
+    return asyncio.run(_run_job(job, output_dir, max_charts, render_mode))
+
+
+async def _run_pool(next_job, on_record, concurrency: int, output_dir: str, max_charts: int, render_mode: str) -> None:
+    """
+    `concurrency` tâches en parallèle dans la boucle courante. Le rendu (pandas,
+    matplotlib) reste séquentiel ; seuls les appels LLM, faits dans des threads, se chevauchent.
+    """
+    async def consume():
+        while (job := next_job()) is not None:
+            on_record(await _run_job(job, output_dir, max_charts, render_mode))
+
+    await asyncio.gather(*(consume() for _ in range(max(concurrency, 1))))
+
+
+def _worker_main(jobs, records, concurrency: int, output_dir: str, max_charts: int, render_mode: str) -> None:
+    """Boucle d'un processus worker : tire les tâches de la file partagée, renvoie chaque résultat aussitôt"""
+    def next_job():
+        try:
+            return jobs.get_nowait()  # File remplie avant le démarrage des workers
+        except queue.Empty:
+            return None
+
+    asyncio.run(_run_pool(next_job, records.put, concurrency, output_dir, max_charts, render_mode))
+
+
+def run_batch(jobs: list, output_dir: str, workers: int = 1, llm_concurrency: int = 4,
+              max_charts: int = 3, render_mode: str = "image", resume: bool = True) -> dict:
+    """Exécute toutes les tâches et retourne le rapport de débit"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    completed = load_completed(output_dir) if resume else set()
+    pending = [job for job in jobs if job["job_id"] not in completed]
+
+    start = time.perf_counter()
+    records = []
+    semaphore = multiprocessing.BoundedSemaphore(llm_concurrency)
+    # Tâches simultanées par processus : de quoi occuper llm_concurrency appels LLM au total
+    concurrency = max(math.ceil(llm_concurrency / max(workers, 1)), 1)
+
+    with open(output_dir / PROGRESS_FILE, "a", encoding="utf-8") as progress:
+        def checkpoint(record):
+            records.append(record)
+            progress.write(json.dumps(record, ensure_ascii=False) + "\n")
+            progress.flush()
+            print(f"[{len(records)}/{len(pending)}] {record['job_id']} : {record['status']} "
+                  f"({record['charts']} graphique(s), {record['seconds']}s)", file=sys.stderr)
+
+        if workers <= 1:
+            # Un seul processus (debug, tests) : mêmes tâches concurrentes, sans pool
+            _worker_init(semaphore, 1)
+            queued = list(reversed(pending))
+            asyncio.run(_run_pool(
+                lambda: queued.pop() if queued else None, checkpoint,
+                concurrency, str(output_dir), max_charts, render_mode
+            ))
+        else:
+            with multiprocessing.Manager() as manager, ProcessPoolExecutor(
+                    max_workers=workers, initializer=_worker_init, initargs=(semaphore, workers)) as pool:
+                job_queue, record_queue = manager.Queue(), manager.Queue()
+                for job in pending:
+                    job_queue.put(job)
+                futures = [
+                    pool.submit(_worker_main, job_queue, record_queue, concurrency, str(output_dir), max_charts, render_mode)
+                    for _ in range(workers)
+                ]
+                while len(records) < len(pending):
+                    try:
+                        checkpoint(record_queue.get(timeout=1.0))
+                    except queue.Empty:
+                        if all(f.done() for f in futures) and record_queue.empty():
+                            break  # Un worker est mort : ses tâches restent à reprendre
+                for future in futures:
+                    future.result()  # Remonte l'erreur d'un worker tombé
+
+    return _report(records, len(completed), time.perf_counter() - start)
+
+
+def _report(records: list, skipped: int, elapsed: float) -> dict:
+    ok = [r for r in records if r["status"] == "ok"]
+    degraded = [r for r in records if r["status"] == "degraded"]
+    charts = sum(r["charts"] for r in records)
+    return {
+        "jobs": len(records),
+        "ok": len(ok),
+        "degraded": len(degraded),
+        "failed": len(records) - len(ok) - len(degraded),
+        "skipped": skipped,
+        "charts": charts,
+        "wall_seconds": round(elapsed, 2),
+        "jobs_per_minute": round(len(records) / elapsed * 60, 2) if elapsed else 0.0,
+        "charts_per_minute": round(charts / elapsed * 60, 2) if elapsed else 0.0,
+        "mean_job_seconds": round(sum(r["seconds"] for r in records) / len(records), 2) if records else 0.0,
+        "input_tokens": sum(r["input_tokens"] for r in records),
+        "output_tokens": sum(r["output_tokens"] for r in records),
+    }
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(description="Génération de graphiques par lots (sans serveur HTTP)")
+    parser.add_argument("manifest", help="CSV ou JSONL avec les colonnes csv_path et problem")
+    parser.add_argument("--output", default="batch_output", help="Dossier de sortie (images, code, résumés)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Nombre de processus")
+    parser.add_argument("--llm-concurrency", type=int, default=4,
+                        help="Appels LLM simultanés max (tous processus) ; fixe aussi les tâches simultanées par worker")
+    parser.add_argument("--max-charts", type=int, default=3, help="Graphiques générés par dataset")
+    parser.add_argument("--render-mode", choices=["image", "plotly"], default="image")
+    parser.add_argument("--no-resume", action="store_true", help="Ignorer le checkpoint et tout relancer")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    report = run_batch(
+        load_manifest(args.manifest),
+        output_dir=args.output,
+        workers=args.workers,
+        llm_concurrency=args.llm_concurrency,
+        max_charts=args.max_charts,
+        render_mode=args.render_mode,
+        resume=not args.no_resume,
+    )
+
+    print("\n=== Rapport de debit ===")
+    for key, value in report.items():
+        print(f"{key:>18} : {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+
+MAX_BARS = 15
+MAX_PIE_SLICES = 8
+MAX_BOX_CATEGORIES = 10
+MAX_SCATTER_POINTS = 5000
+MAX_LINE_POINTS = 2000
+HISTOGRAM_BINS = 30
+HEATMAP_MAX_COLUMNS = 8
+
+
+def _round(values) -> list:
+    """Liste JSON compacte : 4 chiffres significatifs, NaN -> null (hauteurs de barres, parts)"""
+    arr = np.asarray(values, dtype=np.float64)
+    return [float(f"{v:.4g}") if np.isfinite(v) else None for v in arr]
+
+
+def _exact(values) -> list:
+    """Positions sur un axe (coordonnées, centres, quartiles) : pleine précision, NaN -> null"""
+    arr = np.asarray(values, dtype=np.float64)
+    return [float(v) if np.isfinite(v) else None for v in arr]
+
+
+def _labels(values) -> list:
+    return [str(v) for v in values]
+
+
+def _pretty(col: str) -> str:
+    return str(col).replace('_', ' ').title()
+
+
+def resolve_columns(proposal: dict, df: pd.DataFrame) -> tuple:
+    """
+    Valide les variables de la proposition contre les colonnes du dataset.
+    Retourne (x_col, y_col) : catégorielle/numérique si possible, sinon premiers choix valides.
+    """
+    numeric_cols = df.select_dtypes(include='number').columns.tolist()
+    categorical_cols = df.select_dtypes(include=['object', 'category', 'string']).columns.tolist()
+    valid_vars = [v for v in proposal.get('variables', []) if v in df.columns]
+
+    x_col = next((v for v in valid_vars if v in categorical_cols), None)
+    y_col = next((v for v in valid_vars if v in numeric_cols), None)
+
+    if proposal.get('chart_type', '').lower() in ('scatter', 'line'):
+        # Deux axes numériques (ou date en x pour une courbe)
+        axis_cols = [v for v in valid_vars if v in numeric_cols or pd.api.types.is_datetime64_any_dtype(df[v])]
+        axis_cols += [c for c in numeric_cols if c not in axis_cols]
+        if len(axis_cols) >= 2:
+            return axis_cols[0], axis_cols[1]
+
+    x_col = x_col or (categorical_cols[0] if categorical_cols else None)
+    y_col = y_col or (numeric_cols[0] if numeric_cols else None)
+    return x_col, y_col
+
+
+def _bar(df, x_col, y_col) -> list:
+    agg = df.groupby(x_col, observed=True)[y_col].sum().sort_values(ascending=False).head(MAX_BARS)
+    return [{"type": "bar", "x": _labels(agg.index), "y": _round(agg.values)}]
+
+
+def _pie(df, x_col, y_col) -> list:
+    agg = df.groupby(x_col, observed=True)[y_col].sum().sort_values(ascending=False)
+    if len(agg) > MAX_PIE_SLICES:
+        top = agg.head(MAX_PIE_SLICES - 1)
+        top['Autre'] = agg.iloc[MAX_PIE_SLICES - 1:].sum()
+        agg = top
+    return [{"type": "pie", "labels": _labels(agg.index), "values": _round(agg.values), "hole": 0}]
+
+
+def _box(df, x_col, y_col) -> list:
+    """Quartiles pré-calculés : la boîte ne transporte que 5 valeurs par catégorie"""
+    top_cats = df[x_col].value_counts().head(MAX_BOX_CATEGORIES).index
+    stats = df[df[x_col].isin(top_cats)].groupby(x_col, observed=True)[y_col].quantile([0, 0.25, 0.5, 0.75, 1]).unstack()
+    return [{
+        "type": "box",
+        "x": _labels(stats.index),
+        "lowerfence": _exact(stats[0]),
+        "q1": _exact(stats[0.25]),
+        "median": _exact(stats[0.5]),
+        "q3": _exact(stats[0.75]),
+        "upperfence": _exact(stats[1]),
+    }]
+
+
+def _histogram(df, y_col) -> list:
+    """Histogramme pré-agrégé (30 barres) au lieu d'envoyer toutes les valeurs"""
+    values = df[y_col].dropna().to_numpy(dtype=np.float64)
+    counts, edges = np.histogram(values, bins=HISTOGRAM_BINS)
+    centers = (edges[:-1] + edges[1:]) / 2
+    return [{"type": "bar", "x": _exact(centers), "y": counts.tolist(), "width": float(edges[1] - edges[0])}]
+
+
+def _axis_values(series: pd.Series) -> list:
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return [v.isoformat() if not pd.isna(v) else None for v in series]
+    return _exact(series.to_numpy(dtype=np.float64, na_value=np.nan))
+
+
+def _scatter(df, x_col, y_col) -> list:
+    plot_df = df[[x_col, y_col]].dropna()
+    if len(plot_df) > MAX_SCATTER_POINTS:
+        plot_df = plot_df.sample(MAX_SCATTER_POINTS, random_state=42)
+    return [{
+        "type": "scattergl",
+        "mode": "markers",
+        "x": _axis_values(plot_df[x_col]),
+        "y": _axis_values(plot_df[y_col]),
+        "marker": {"opacity": 0.5},
+    }]
+
+
+def _line(df, x_col, y_col) -> list:
+    """Moyenne par valeur de x, puis regroupement en au plus 2000 points"""
+    agg = df.groupby(x_col, observed=True)[y_col].mean().sort_index()
+    if len(agg) > MAX_LINE_POINTS:
+        buckets = np.arange(len(agg)) * MAX_LINE_POINTS // len(agg)
+        x_first = pd.Series(agg.index).groupby(buckets).first()
+        y_mean = pd.Series(agg.values).groupby(buckets).mean()
+        agg = pd.Series(y_mean.values, index=x_first.values)
+    return [{"type": "scatter", "mode": "lines", "x": _axis_values(pd.Series(agg.index)), "y": _exact(agg.values)}]
+
+
+def _heatmap(df) -> list:
+    numeric = df.select_dtypes(include='number').iloc[:, :HEATMAP_MAX_COLUMNS]
+    corr = numeric.corr().round(2)
+    return [{
+        "type": "heatmap",
+        "x": _labels(corr.columns),
+        "y": _labels(corr.index),
+        "z": [_round(row) for row in corr.to_numpy()],
+        "zmin": -1,
+        "zmax": 1,
+        "colorscale": "RdBu",
+    }]
+
+
+def build_plotly_spec(proposal: dict, df: pd.DataFrame) -> dict:
+    """
+    Spec Plotly JSON compacte construite à partir de données pré-agrégées.
+    Le navigateur fait le rendu : le serveur ne paie que l'agrégation.
+    """
+    chart_type = proposal.get('chart_type', 'bar').lower()
+    x_col, y_col = resolve_columns(proposal, df)
+    numeric_count = len(df.select_dtypes(include='number').columns)
+
+    layout = {
+        "title": {"text": proposal.get('title', 'Visualisation'), "font": {"size": 18}},
+        "template": "plotly_white",
+    }
+
+    if chart_type == 'pie' and x_col and y_col:
+        data = _pie(df, x_col, y_col)
+    elif chart_type in ('scatter', 'line') and x_col and y_col and x_col != y_col and (
+            pd.api.types.is_numeric_dtype(df[x_col]) or pd.api.types.is_datetime64_any_dtype(df[x_col])):
+        data = _scatter(df, x_col, y_col) if chart_type == 'scatter' else _line(df, x_col, y_col)
+        layout["xaxis"] = {"title": {"text": _pretty(x_col)}}
+        layout["yaxis"] = {"title": {"text": _pretty(y_col)}}
+    elif chart_type == 'box' and x_col and y_col:
+        data = _box(df, x_col, y_col)
+        layout["yaxis"] = {"title": {"text": _pretty(y_col)}}
+    elif chart_type == 'histogram' and y_col:
+        data = _histogram(df, y_col)
+        layout["xaxis"] = {"title": {"text": _pretty(y_col)}}
+        layout["bargap"] = 0
+    elif chart_type == 'heatmap' and numeric_count >= 2:
+        data = _heatmap(df)
+    elif x_col and y_col:
+        data = _bar(df, x_col, y_col)
+        layout["yaxis"] = {"title": {"text": _pretty(y_col)}}
+    elif y_col:
+        data = _histogram(df, y_col)
+    else:
+        counts = df[df.columns[0]].value_counts().head(MAX_BARS)
+        data = [{"type": "bar", "x": _labels(counts.index), "y": counts.tolist()}]
+
+    return {"data": data, "layout": layout}
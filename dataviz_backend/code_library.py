@@ -0,0 +1,170 @@
+import ast
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from .datasets import column_kind
+
+MAX_SIGNATURES = 500
+MAX_VARIANTS = 3  # Codes conservés par signature (essayés du plus fiable au moins fiable)
+MIN_ATTEMPTS_BEFORE_EVICTION = 3
+MIN_SUCCESS_RATE = 0.5
+
+
+def schema_signature(df: pd.DataFrame, proposal: dict) -> str:
+    """
+    Signature d'un graphique : colonnes (nom + nature), type de graphique, variables.
+    La nature (number/text/datetime/bool) plutôt que le dtype exact : un export
+    hebdomadaire peut passer de int à float (valeurs manquantes) ou de category
+    à string selon la cardinalité, sans que le code généré cesse de fonctionner.
+    """
+    payload = {
+        "columns": [[str(col), column_kind(df[col])] for col in df.columns],
+        "chart_type": str(proposal.get("chart_type", "")).lower(),
+        "variables": list(proposal.get("variables", [])),
+    }
+    return hashlib.sha1(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+TITLE_CALLS = ("title", "set_title", "suptitle")  # plt.title(...), ax.set_title(...), fig.suptitle(...)
+
+
+def _title_literals(tree: ast.AST, title: str) -> list:
+    """Littéraux égaux au titre passés à un appel de titre (1er argument ou label=)"""
+    literals = []
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in TITLE_CALLS):
+            continue
+        for arg in node.args[:1] + [k.value for k in node.keywords if k.arg == "label"]:
+            if isinstance(arg, ast.Constant) and arg.value == title and arg.lineno == arg.end_lineno:
+                literals.append(arg)
+    return literals
+
+
+def retitle(code: str, old_title: str, new_title: str) -> str:
+    """
+    Remplace le titre d'origine par celui de la nouvelle proposition, uniquement dans
+    l'argument des appels de titre : une colonne ou une étiquette contenant le même texte
+    reste intacte. Les offsets de l'AST sont en octets UTF-8.
+    """
+    if not old_title or not new_title or old_title == new_title:
+        return code
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code
+
+    lines = code.splitlines(keepends=True)
+    for node in sorted(_title_literals(tree, old_title), key=lambda n: (n.lineno, n.col_offset), reverse=True):
+        line = lines[node.lineno - 1].encode("utf-8")
+        literal = repr(new_title).encode("utf-8")  # repr échappe guillemets et retours à la ligne
+        lines[node.lineno - 1] = (line[:node.col_offset] + literal + line[node.end_col_offset:]).decode("utf-8")
+    return "".join(lines)
+
+
+class CodeLibrary:
+    """
+    Bibliothèque de code généré ayant déjà produit un graphique, indexée par signature
+    de schéma. Les entrées qui échouent de façon répétée sont évincées.
+    Optionnellement persistée en JSON (CODE_LIBRARY_PATH) pour survivre aux redémarrages.
+    """
+
+    def __init__(self, path: str = None, max_signatures: int = MAX_SIGNATURES):
+        self.path = path
+        self.max_signatures = max_signatures
+        self._entries = OrderedDict()  # signature -> [{code, title, successes, failures, last_used}]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path and os.path.exists(path):
+            self._load()
+
+    @classmethod
+    def from_env(cls) -> "CodeLibrary":
+        return cls(path=os.getenv("CODE_LIBRARY_PATH") or None)
+
+    def candidates(self, signature: str) -> list:
+        """Codes connus pour cette signature, du meilleur taux de succès au pire"""
+        with self._lock:
+            variants = self._entries.get(signature)
+            if not variants:
+                self.misses += 1
+                return []
+            self._entries.move_to_end(signature)
+            return [dict(v) for v in sorted(variants, key=self._score, reverse=True)]
+
+    @staticmethod
+    def _score(entry: dict) -> tuple:
+        attempts = entry["successes"] + entry["failures"]
+        return (entry["successes"] / attempts if attempts else 0.0, entry["successes"])
+
+    def record_success(self, signature: str, code: str, title: str = "") -> None:
+        """Ajoute le code (ou incrémente ses succès s'il est déjà connu)"""
+        with self._lock:
+            variants = self._entries.setdefault(signature, [])
+            self._entries.move_to_end(signature)
+            entry = next((v for v in variants if v["code"] == code), None)
+            if entry is None:
+                if len(variants) >= MAX_VARIANTS:
+                    variants.remove(min(variants, key=self._score))
+                entry = {"code": code, "title": title, "successes": 0, "failures": 0}
+                variants.append(entry)
+            entry["successes"] += 1
+            entry["last_used"] = time.time()
+            while len(self._entries) > self.max_signatures:
+                self._entries.popitem(last=False)
+        self._save()
+
+    def record_hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def record_failure(self, signature: str, code: str) -> None:
+        """Compte un échec ; évince l'entrée si elle échoue trop souvent"""
+        with self._lock:
+            variants = self._entries.get(signature, [])
+            entry = next((v for v in variants if v["code"] == code), None)
+            if entry is None:
+                return
+            entry["failures"] += 1
+            attempts = entry["successes"] + entry["failures"]
+            if attempts >= MIN_ATTEMPTS_BEFORE_EVICTION and self._score(entry)[0] < MIN_SUCCESS_RATE:
+                variants.remove(entry)
+                self.evictions += 1
+                if not variants:
+                    del self._entries[signature]
+        self._save()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "signatures": len(self._entries),
+                "entries": sum(len(v) for v in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._entries = OrderedDict(json.load(f))
+        except (OSError, ValueError):
+            self._entries = OrderedDict()  # Fichier corrompu : on repart de zéro
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps(self._entries, ensure_ascii=False)
+        # Écriture atomique : un autre processus (batch) ne lit jamais un fichier tronqué
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
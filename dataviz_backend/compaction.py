@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+CATEGORY_MAX_RATIO = 0.5  # Catégoriel si moins de 50% de valeurs distinctes
+STRING_DTYPE = "string[pyarrow]"  # Chaînes stockées dans des buffers Arrow contigus
+# Les entiers ne sont réduits qu'à la demande (compact_ints=True), jamais dans un
+# DataFrame passé à exec : numpy ne promeut pas int32 * int32, et le code généré
+# (prix * quantité) déborderait silencieusement (150000 * 20000 -> -1294967296)
+MIN_INT_DTYPE = np.int32
+
+
+def memory_usage_bytes(df: pd.DataFrame) -> int:
+    """Empreinte mémoire réelle du DataFrame (chaînes comprises)"""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def _compact_strings(series: pd.Series) -> pd.Series:
+    """Chaînes -> category si faible cardinalité, sinon chaînes Arrow"""
+    non_null = series.count()
+    if non_null and series.nunique(dropna=True) / non_null <= CATEGORY_MAX_RATIO:
+        return series.astype("category")
+    if HAS_PYARROW and series.dtype == object:
+        # Seulement si la colonne ne contient vraiment que des chaînes
+        if pd.api.types.infer_dtype(series, skipna=True) == "string":
+            return series.astype(STRING_DTYPE)
+    return series
+
+
+def _compact_int(series: pd.Series) -> pd.Series:
+    """int64 -> int32 si toutes les valeurs tiennent dans l'intervalle"""
+    if series.dtype != np.int64 or series.empty:
+        return series
+    info = np.iinfo(MIN_INT_DTYPE)
+    if info.min <= series.min() and series.max() <= info.max:
+        return series.astype(MIN_INT_DTYPE)
+    return series
+
+
+def _compact_float(series: pd.Series) -> pd.Series:
+    """float64 -> float32 uniquement si toutes les valeurs sont représentables exactement"""
+    if series.dtype != np.float64:
+        return series
+    values = series.to_numpy()
+    finite = np.isfinite(values)
+    if np.abs(values[finite]).max(initial=0.0) > np.finfo(np.float32).max:
+        return series
+    as_float32 = values.astype(np.float32)
+    if np.array_equal(as_float32.astype(np.float64), values, equal_nan=True):
+        return pd.Series(as_float32, index=series.index, name=series.name)
+    return series
+
+
+def widen_for_exec(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Types larges pour le DataFrame passé à exec (≤ MAX_ROWS_VIZ lignes) : les types
+    compacts restent réservés au stockage. Catégories -> chaînes (regrouper dans
+    "Autre" ajouterait une catégorie inconnue -> TypeError) ; float32 -> float64
+    (prix * quantité et sommes calculés en float32 perdent des chiffres).
+    """
+    widened = {}
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            widened[col] = series.astype(series.cat.categories.dtype)
+        elif series.dtype == np.float32:
+            widened[col] = series.astype(np.float64)
+    if not widened:
+        return df
+    return pd.DataFrame({col: widened.get(col, df[col]) for col in df.columns}, index=df.index)
+
+
+def compact_dataframe(df: pd.DataFrame, compact_ints: bool = False) -> tuple:
+    """
+    Réduit l'empreinte mémoire du DataFrame sans perte d'information.
+    compact_ints : int64 -> int32, réservé aux DataFrames qui ne passent pas par exec.
+    Retourne (df_compact, rapport mémoire avant/après en octets).
+    """
+    before = memory_usage_bytes(df)
+
+    compacted = {}
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_bool_dtype(series):
+            compacted[col] = series
+        elif compact_ints and pd.api.types.is_integer_dtype(series):
+            compacted[col] = _compact_int(series)
+        elif pd.api.types.is_float_dtype(series):
+            compacted[col] = _compact_float(series)
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            compacted[col] = _compact_strings(series)
+        else:
+            compacted[col] = series
+
+    df = pd.DataFrame(compacted, index=df.index)
+    after = memory_usage_bytes(df)
+
+    report = {
+        "before_bytes": before,
+        "after_bytes": after,
+        "ratio": round(after / before, 3) if before else 1.0,
+    }
+    return df, report
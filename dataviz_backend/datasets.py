@@ -0,0 +1,361 @@
+import ast
+import json
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .compaction import compact_dataframe, memory_usage_bytes
+
+# Mêmes limites que l'Agent 1
+MAX_NUMERIC_STATS = 10
+MAX_CORR_COLUMNS = 8
+MAX_CATEGORY_COLUMNS = 10
+TOP_CATEGORIES = 10
+MAX_DISTINCT_VALUES = 1000  # Au-delà (identifiants, texte libre), la colonne n'est plus comptée
+
+
+class DatasetNotFound(Exception):
+    """Levée quand un dataset_id est inconnu ou a été évincé du store"""
+
+
+def new_dataset_id() -> str:
+    """
+    Identifiant propre à chaque analyse : un dataset est modifié en place par les ajouts
+    de lignes, il ne peut donc pas être partagé entre deux envois du même fichier.
+    """
+    return uuid.uuid4().hex[:16]
+
+
+def chart_key(proposal: dict, render_mode: str) -> str:
+    """Clé de cache d'un graphique : ce qui détermine son rendu, hors données"""
+    return json.dumps({
+        "title": proposal.get("title"),
+        "chart_type": proposal.get("chart_type"),
+        "variables": proposal.get("variables", []),
+        "render_mode": render_mode,
+    }, sort_keys=True, ensure_ascii=False)
+
+
+def referenced_columns(code: str, columns) -> list:
+    """Colonnes citées comme littéraux dans le code (df['col'], x='col'...), via l'AST"""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+    columns = set(columns)
+    found = {
+        node.value for node in ast.walk(tree)
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and node.value in columns
+    }
+    return sorted(found)
+
+
+def column_kind(series: pd.Series) -> str:
+    """Nature de la colonne telle que la voient les agents (un int qui devient float ne compte pas)"""
+    if pd.api.types.is_bool_dtype(series):
+        return "bool"
+    if pd.api.types.is_numeric_dtype(series):
+        return "number"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime"
+    return "text"
+
+
+def _is_text(series: pd.Series) -> bool:
+    return column_kind(series) == "text"
+
+
+class MergeableStats:
+    """
+    Statistiques fusionnables : chaque lot ajoute ses sommes, sans relire les lignes
+    déjà vues. Les sommes sont décalées par une valeur de référence par colonne
+    (moyenne du premier lot) pour limiter les erreurs d'arrondi.
+    """
+
+    def __init__(self):
+        self.shift = {}
+        self.numeric = {}  # col -> {count, sum, min, max}
+        self.numeric_columns = None  # Fixées au premier lot : les colonnes au-delà des limites ne sont jamais lues
+        self.corr_columns = None
+        self.pairs = {}  # (col_a, col_b) -> [n, sa, sb, saa, sbb, sab]
+        self.categories = {}  # col -> Counter
+        self.high_cardinality = set()  # Colonnes abandonnées : leur Counter croîtrait avec chaque lot
+
+    def _values(self, df: pd.DataFrame, col: str) -> np.ndarray:
+        return df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    def update(self, df: pd.DataFrame) -> None:
+        if self.numeric_columns is None:
+            self.numeric_columns = [c for c in df.columns if column_kind(df[c]) == "number"][:MAX_NUMERIC_STATS]
+        numeric_cols = [c for c in self.numeric_columns if c in df.columns]
+        values = {}
+        for col in numeric_cols:
+            v = values[col] = self._values(df, col)
+            finite = v[np.isfinite(v)]
+            if col not in self.shift:
+                self.shift[col] = float(finite.mean()) if len(finite) else 0.0
+                self.numeric[col] = {"count": 0, "sum": 0.0, "min": np.inf, "max": -np.inf}
+            if not len(finite):
+                continue
+            stats = self.numeric[col]
+            stats["count"] += int(len(finite))
+            stats["sum"] += float((finite - self.shift[col]).sum())
+            stats["min"] = min(stats["min"], float(finite.min()))
+            stats["max"] = max(stats["max"], float(finite.max()))
+
+        if self.corr_columns is None:
+            self.corr_columns = self.numeric_columns[:MAX_CORR_COLUMNS]
+        for i, a in enumerate(self.corr_columns):
+            for b in self.corr_columns[i + 1:]:
+                if a not in values or b not in values:
+                    continue
+                va, vb = values[a], values[b]
+                mask = np.isfinite(va) & np.isfinite(vb)
+                da, db = va[mask] - self.shift[a], vb[mask] - self.shift[b]
+                acc = self.pairs.setdefault((a, b), [0, 0.0, 0.0, 0.0, 0.0, 0.0])
+                acc[0] += int(mask.sum())
+                acc[1] += float(da.sum())
+                acc[2] += float(db.sum())
+                acc[3] += float((da * da).sum())
+                acc[4] += float((db * db).sum())
+                acc[5] += float((da * db).sum())
+
+        text_cols = [c for c in df.columns if _is_text(df[c])]
+        for col in text_cols:
+            if col in self.high_cardinality:
+                continue
+            if col not in self.categories and len(self.categories) + len(self.high_cardinality) >= MAX_CATEGORY_COLUMNS:
+                continue
+            counts = df[col].value_counts(dropna=True)
+            counter = self.categories.setdefault(col, Counter())
+            counter.update({str(k): int(v) for k, v in counts.items() if v})
+            if len(counter) > MAX_DISTINCT_VALUES:
+                del self.categories[col]
+                self.high_cardinality.add(col)
+
+    def numeric_stats(self) -> dict:
+        result = {}
+        for col, stats in self.numeric.items():
+            if not stats["count"]:
+                continue
+            result[col] = {
+                "mean": round(stats["sum"] / stats["count"] + self.shift[col], 2),
+                "min": round(stats["min"], 2),
+                "max": round(stats["max"], 2),
+            }
+        return result
+
+    def _corr(self, a: str, b: str):
+        n, sa, sb, saa, sbb, sab = self.pairs[(a, b)]
+        cov = n * sab - sa * sb
+        var = (n * saa - sa * sa) * (n * sbb - sb * sb)
+        if n < 2 or var <= 0:
+            return None
+        return round(float(cov / np.sqrt(var)), 2)
+
+    def correlations(self):
+        """Même format que DataFrame.corr().to_dict()"""
+        cols = self.corr_columns or []
+        if len(cols) < 2:
+            return None
+        result = {b: {} for b in cols}
+        for b in cols:
+            for a in cols:
+                if a == b:
+                    result[b][a] = 1.0
+                else:
+                    key = (a, b) if (a, b) in self.pairs else (b, a)
+                    result[b][a] = self._corr(*key) if key in self.pairs else None
+        return result
+
+    def category_counts(self) -> dict:
+        return {col: dict(counts.most_common(TOP_CATEGORIES)) for col, counts in self.categories.items()}
+
+
+class Dataset:
+    """Dataset conservé côté serveur : lots de lignes + statistiques + caches dérivés"""
+
+    def __init__(self, key: str, df: pd.DataFrame):
+        df = self._prepare(df)
+        self.id = key
+        self.chunks = [df]
+        self._frame = df
+        self.rows = len(df)
+        self.nbytes = memory_usage_bytes(df)
+        self.kinds = {col: column_kind(df[col]) for col in df.columns}
+        self.dtypes = df.dtypes.to_dict()
+        self.stats = MergeableStats()
+        self.stats.update(df)
+        self.versions = dict.fromkeys(df.columns, 0)
+        self.summaries = {}  # problématique -> résumé de l'Agent 1 (insights LLM)
+        self.charts = {}  # chart_key -> {"result", "versions"}
+
+    @staticmethod
+    def _prepare(df: pd.DataFrame) -> pd.DataFrame:
+        unnamed_cols = [c for c in df.columns if 'Unnamed' in str(c)]
+        if unnamed_cols:
+            df = df.drop(columns=unnamed_cols)
+        df, _ = compact_dataframe(df)
+        return df
+
+    def frame(self) -> pd.DataFrame:
+        """DataFrame complet ; les lots ajoutés ne sont concaténés qu'au premier besoin"""
+        if self._frame is None:
+            chunks = self.chunks
+            for col in self.versions:
+                if any(isinstance(c[col].dtype, pd.CategoricalDtype) for c in chunks if col in c):
+                    # Catégories unifiées, sinon concat retombe sur des chaînes
+                    categories = pd.Index(pd.unique(np.concatenate([
+                        (c[col].cat.categories if isinstance(c[col].dtype, pd.CategoricalDtype)
+                         else c[col].dropna().unique()).astype(object)
+                        for c in chunks if col in c
+                    ])))
+                    dtype = pd.CategoricalDtype(categories)
+                    chunks = [c.assign(**{col: c[col].astype(dtype)}) if col in c else c for c in chunks]
+            self._frame = pd.concat(chunks, ignore_index=True)
+            self.chunks = [self._frame]
+        return self._frame
+
+    def summary_stats(self) -> dict:
+        return {
+            "rows": self.rows,
+            "numeric_stats": self.stats.numeric_stats(),
+            "correlations": self.stats.correlations(),
+            "category_counts": self.stats.category_counts(),
+        }
+
+    def append(self, batch: pd.DataFrame) -> dict:
+        """
+        Ajoute des lignes : coût proportionnel au lot (les statistiques sont fusionnées).
+        Retourne les colonnes modifiées et si le schéma a changé.
+        """
+        batch = self._align_empty_columns(self._prepare(batch))
+        batch_kinds = {col: column_kind(batch[col]) for col in batch.columns}
+        schema_changed = batch_kinds != self.kinds
+
+        self.chunks.append(batch)
+        self._frame = None
+        self.rows += len(batch)
+        self.nbytes += memory_usage_bytes(batch)
+
+        changed_columns = [col for col in batch.columns if batch[col].notna().any()]
+        for col in changed_columns:
+            self.versions[col] = self.versions.get(col, 0) + 1
+
+        if schema_changed:
+            # Nouvelles colonnes ou changement de nature : on repart de zéro (rare)
+            self.stats = MergeableStats()
+            self.stats.update(self.frame())
+            self.kinds = {col: column_kind(self._frame[col]) for col in self._frame.columns}
+            self.dtypes = self._frame.dtypes.to_dict()
+        else:
+            self.stats.update(batch)
+
+        return {
+            "appended": len(batch),
+            "changed_columns": changed_columns,
+            "schema_changed": schema_changed,
+        }
+
+    def _align_empty_columns(self, batch: pd.DataFrame) -> pd.DataFrame:
+        """
+        Une colonne vide dans le lot (cellules blanches) n'a pas de type propre : le parseur
+        la lit en float64 ou object. Elle prend le type stocké, sinon elle passerait pour
+        un changement de nature et concat la dégraderait en object.
+        """
+        aligned = {}
+        for col in batch.columns:
+            dtype = self.dtypes.get(col)
+            if dtype is None or batch[col].dtype == dtype or batch[col].notna().any():
+                continue
+            if pd.api.types.is_bool_dtype(dtype):
+                dtype = "boolean"  # bool ne représente pas les valeurs manquantes
+            elif pd.api.types.is_integer_dtype(dtype):
+                dtype = np.float64
+            aligned[col] = pd.Series(index=batch.index, dtype=dtype)
+        if not aligned:
+            return batch
+        return pd.DataFrame({col: aligned.get(col, batch[col]) for col in batch.columns}, index=batch.index)
+
+    def get_chart(self, key: str) -> tuple:
+        """(entrée de cache, à jour ?) ; une entrée est périmée si une de ses colonnes a changé"""
+        entry = self.charts.get(key)
+        if entry is None:
+            return None, False
+        fresh = all(self.versions.get(col) == v for col, v in entry["versions"].items())
+        return entry, fresh
+
+    def store_chart(self, key: str, result: dict, columns: list) -> None:
+        columns = columns or list(self.versions)
+        self.charts[key] = {
+            "result": result,
+            "versions": {col: self.versions.get(col) for col in columns},
+        }
+
+    def stale_charts(self) -> int:
+        return sum(1 for key in self.charts if not self.get_chart(key)[1])
+
+
+class DatasetStore:
+    """Datasets en mémoire, LRU borné en octets"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._last_used = {}
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(d.nbytes for d in self._items.values())
+
+    def get(self, key: str):
+        with self._lock:
+            dataset = self._items.get(key)
+            if dataset is not None:
+                self._items.move_to_end(key)
+                self._last_used[key] = time.monotonic()
+            return dataset
+
+    def put(self, dataset: Dataset) -> None:
+        with self._lock:
+            self._items[dataset.id] = dataset
+            self._items.move_to_end(dataset.id)
+            self._last_used[dataset.id] = time.monotonic()
+            self._evict_to(self.max_bytes)
+
+    def discard(self, key: str) -> None:
+        """Retire un dataset devenu inutile (fin d'une tâche batch)"""
+        with self._lock:
+            if self._items.pop(key, None) is not None:
+                del self._last_used[key]
+
+    def _evict_to(self, max_bytes: int) -> None:
+        total = sum(d.nbytes for d in self._items.values())
+        while total > max_bytes and len(self._items) > 1:
+            total -= self._pop_oldest()
+
+    def oldest_access(self):
+        """Date du dernier accès au dataset le plus ancien (None si vide)"""
+        with self._lock:
+            return self._last_used[next(iter(self._items))] if self._items else None
+
+    def evict_oldest(self) -> int:
+        """Évince le dataset le moins récemment utilisé ; retourne les octets libérés"""
+        with self._lock:
+            return self._pop_oldest() if self._items else 0
+
+    def _pop_oldest(self) -> int:
+        key, evicted = self._items.popitem(last=False)
+        del self._last_used[key]
+        return evicted.nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._last_used.clear()
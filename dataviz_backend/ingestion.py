@@ -0,0 +1,256 @@
+import codecs
+import csv
+import re
+from collections import Counter
+from io import BytesIO, StringIO
+
+import pandas as pd
+
+from .compaction import HAS_PYARROW
+
+if HAS_PYARROW:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+
+SNIFF_BYTES = 64 * 1024  # Le sniffing ne lit que les premiers Ko
+SNIFF_ROWS = 50
+CANDIDATE_DELIMITERS = [",", ";", "\t", "|"]
+FALLBACK_ENCODINGS = ("cp1252", "latin-1")  # latin-1 décode n'importe quel octet
+
+NUMBER_DOT = re.compile(r"^[-+]?\d+(\.\d+)?([eE][-+]?\d+)?$")
+NUMBER_COMMA = re.compile(r"^[-+]?\d+,\d+$")
+INTEGER = re.compile(r"^[-+]?\d+$")
+DATE_LIKE = re.compile(r"^\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}([ T]\d{1,2}:\d{2}(:\d{2})?)?$")
+DATE_MIN_RATIO = 0.9  # Part minimale de valeurs au format date
+
+
+def detect_encoding(raw: bytes) -> str:
+    """Détecte l'encodage sur les premiers Ko (UTF-8, sinon Windows-1252/Latin-1)"""
+    sample = raw[:SNIFF_BYTES]
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # Décodeur incrémental : tolère un caractère multi-octets coupé en fin d'échantillon
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=len(raw) <= SNIFF_BYTES)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    for encoding in FALLBACK_ENCODINGS:
+        try:
+            sample.decode(encoding)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return "latin-1"
+
+
+def decode_csv(raw: bytes) -> tuple:
+    """Décode le fichier brut. Retourne (texte, encodage détecté)"""
+    encoding = detect_encoding(raw)
+    for candidate in (encoding,) + FALLBACK_ENCODINGS:
+        try:
+            return raw.decode(candidate), candidate
+        except UnicodeDecodeError:
+            # Octet invalide au-delà de l'échantillon sniffé
+            continue
+    return raw.decode("latin-1"), "latin-1"
+
+
+def _detect_delimiter(lines: list) -> str:
+    """Séparateur le plus fréquent ET le plus régulier d'une ligne à l'autre"""
+    try:
+        return csv.Sniffer().sniff("\n".join(lines), delimiters="".join(CANDIDATE_DELIMITERS)).delimiter
+    except csv.Error:
+        pass
+    best, best_score = ",", 0
+    for delimiter in CANDIDATE_DELIMITERS:
+        counts = [line.count(delimiter) for line in lines]
+        if counts and min(counts) > 0 and len(set(counts)) == 1 and counts[0] > best_score:
+            best, best_score = delimiter, counts[0]
+    return best
+
+
+def _looks_like_date(values: list) -> bool:
+    values = [v for v in values if v]
+    if not values:
+        return False
+    matches = sum(1 for v in values if DATE_LIKE.match(v))
+    return matches / len(values) >= DATE_MIN_RATIO
+
+
+def _cell_kind(value: str) -> str:
+    if not value:
+        return "empty"
+    if INTEGER.match(value):
+        return "int"
+    if NUMBER_DOT.match(value) or NUMBER_COMMA.match(value):
+        return "decimal"
+    if DATE_LIKE.match(value):
+        return "date"
+    return "text"
+
+
+def _detect_header(first: list, body: list) -> bool:
+    """
+    La première ligne est un en-tête si une de ses cellules détonne avec sa colonne :
+    texte au-dessus de nombres/dates, nombre au-dessus de texte, entier au-dessus de
+    décimaux, ou entier d'une autre longueur que ceux de la colonne (`pays,2023,2024`).
+    """
+    first_kinds = [_cell_kind(c) for c in first]
+    if not any(k in ("int", "decimal", "date") for k in first_kinds):
+        return True
+    for i, kind in enumerate(first_kinds):
+        values = [row[i].strip() for row in body if i < len(row) and row[i].strip()]
+        if kind == "empty" or not values:
+            continue
+        kinds = Counter(_cell_kind(v) for v in values)
+        dominant = kinds.most_common(1)[0][0]
+        if kind == "text" and dominant != "text":
+            return True
+        if kind in ("int", "decimal", "date") and dominant == "text":
+            return True
+        if kind == "int" and dominant in ("int", "decimal"):
+            if "int" not in kinds:
+                return True
+            lengths = [len(v) for v in values if _cell_kind(v) == "int"]
+            if not min(lengths) <= len(first[i]) <= max(lengths):
+                return True
+    return False
+
+
+def sniff_csv(csv_data: str) -> dict:
+    """
+    Passe rapide sur le début du fichier : séparateur, séparateur décimal,
+    présence d'un en-tête et colonnes de dates.
+    """
+    lines = [l for l in csv_data[:SNIFF_BYTES].splitlines() if l.strip()]
+    if len(csv_data) > SNIFF_BYTES and len(lines) > 1:
+        lines = lines[:-1]  # Dernière ligne probablement tronquée
+    lines = lines[:SNIFF_ROWS + 1]
+
+    delimiter = _detect_delimiter(lines)
+    rows = list(csv.reader(lines, delimiter=delimiter))
+    if not rows:
+        return {"delimiter": delimiter, "decimal": ".", "has_header": True, "date_columns": [], "dayfirst": False,
+                "columns": []}
+
+    first = [c.strip() for c in rows[0]]
+    has_header = _detect_header(first, rows[1:])
+    body = rows[1:] if has_header else rows
+    cells = [c.strip() for row in body for c in row]
+
+    decimal = "."
+    if delimiter != ",":
+        comma_numbers = sum(1 for c in cells if NUMBER_COMMA.match(c))
+        dot_numbers = sum(1 for c in cells if NUMBER_DOT.match(c) and "." in c)
+        if comma_numbers > dot_numbers:
+            decimal = ","
+
+    names = first if has_header else [f"colonne_{i + 1}" for i in range(len(first))]
+    date_columns, dayfirst = [], False
+    for i, name in enumerate(names):
+        values = [row[i].strip() for row in body if i < len(row)]
+        if _looks_like_date(values):
+            date_columns.append(name)
+            # 15/01/2024 -> jour en premier (les valeurs hors format, ex. "inconnu", sont ignorées)
+            heads = [re.split(r"[-/.]", v)[0] for v in values if DATE_LIKE.match(v)]
+            dayfirst = dayfirst or any(len(h) <= 2 and int(h) > 12 for h in heads)
+
+    return {
+        "delimiter": delimiter,
+        "decimal": decimal,
+        "has_header": has_header,
+        "date_columns": date_columns,
+        "dayfirst": dayfirst,
+        # Noms tels que pandas les lira (sans strip) : sert à la projection de colonnes
+        "columns": rows[0] if has_header else names,
+    }
+
+
+def _read_pandas(csv_data: str, dialect: dict, positions: list = None) -> pd.DataFrame:
+    """Moteur de repli : parser C de pandas"""
+    return pd.read_csv(
+        StringIO(csv_data),
+        sep=dialect["delimiter"],
+        decimal=dialect["decimal"],
+        header=0 if dialect["has_header"] else None,
+        usecols=positions,
+    )
+
+
+def _read_pyarrow(csv_data: str, dialect: dict, positions: list = None) -> pd.DataFrame:
+    """Moteur rapide : lecteur CSV multi-thread de pyarrow"""
+    include_columns = None
+    if positions is not None:
+        names = dialect["columns"] if dialect["has_header"] else [f"f{i}" for i in range(len(dialect["columns"]))]
+        include_columns = [names[i] for i in positions]
+    table = pa_csv.read_csv(
+        BytesIO(csv_data.encode("utf-8")),
+        read_options=pa_csv.ReadOptions(
+            use_threads=True,
+            autogenerate_column_names=not dialect["has_header"],
+        ),
+        parse_options=pa_csv.ParseOptions(delimiter=dialect["delimiter"]),
+        convert_options=pa_csv.ConvertOptions(
+            decimal_point=dialect["decimal"],
+            strings_can_be_null=True,  # "" -> NaN, comme pandas
+            # Les dates sont converties après coup, avec le même dayfirst que pandas
+            column_types={name: "string" for name in dialect["date_columns"]} if dialect["has_header"] else None,
+            include_columns=include_columns,
+        ),
+    )
+    # Colonne sans aucune valeur : type null -> object/None ; pandas la lit en float64 NaN
+    for i, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.float64()))
+    return table.to_pandas()
+
+
+ENGINES = {
+    "pandas": _read_pandas,
+    "pyarrow": _read_pyarrow,
+}
+
+
+def default_engine() -> str:
+    return "pyarrow" if HAS_PYARROW else "pandas"
+
+
+def column_positions(dialect: dict, usecols) -> list:
+    """
+    Positions des colonnes demandées, dans l'ordre du fichier.
+    None (lire tout) si une colonne est inconnue ou si l'en-tête a des doublons.
+    """
+    names = dialect.get("columns") or []
+    if usecols is None or len(set(names)) != len(names) or any(c not in names for c in usecols):
+        return None
+    return sorted({names.index(c) for c in usecols})
+
+
+def read_csv(csv_data: str, dialect: dict = None, engine: str = None, usecols: list = None) -> pd.DataFrame:
+    """
+    Parse le CSV avec le dialecte sniffé et le moteur le plus rapide disponible.
+    `usecols` : ne lire que ces colonnes (les autres ne sont ni converties ni allouées).
+    """
+    dialect = dialect or sniff_csv(csv_data)
+    engine = engine or default_engine()
+    positions = column_positions(dialect, usecols)
+
+    try:
+        df = ENGINES[engine](csv_data, dialect, positions)
+    except Exception:
+        if engine == "pandas":
+            raise
+        # pyarrow est plus strict (lignes irrégulières, guillemets) -> repli pandas
+        df = _read_pandas(csv_data, dialect, positions)
+
+    if not dialect["has_header"]:
+        indices = positions if positions is not None else range(len(df.columns))
+        df.columns = [f"colonne_{i + 1}" for i in indices]
+
+    for col in dialect["date_columns"]:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors="coerce", dayfirst=dialect["dayfirst"])
+
+    return df
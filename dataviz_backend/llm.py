@@ -0,0 +1,258 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+EXPECTED_DEFAULT_SECONDS = 4.0  # Durée supposée d'un appel avant toute mesure
+MIN_LATENCY_SAMPLES = 20
+FALLBACK_RESERVE_SECONDS = 1.0  # Temps gardé pour le rendu de secours après le dernier appel LLM
+
+
+def cached_system(text: str) -> list:
+    """
+    Bloc system marqué pour le prompt caching Anthropic (préfixe stable).
+    L'API ignore le marquage sous un minimum de tokens (2048 pour claude-3-haiku) :
+    les prompts système actuels (~100 à ~400 tokens) n'en bénéficient donc pas
+    avec ce modèle ; le marquage ne coûte rien et prend effet si le préfixe grandit.
+    """
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+
+
+class LLMMetrics:
+    """Compteurs d'usage des appels LLM (tokens, cache) agrégés par agent"""
+
+    FIELDS = (
+        "input_tokens",
+        "output_tokens",
+        "cache_creation_input_tokens",
+        "cache_read_input_tokens",
+    )
+    EVENTS = (
+        "hedged_calls",  # Requêtes dupliquées envoyées
+        "hedge_wins",  # ... qui ont répondu avant l'originale
+        "deadline_fallbacks",  # Étapes dégradées faute de budget de temps
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._agents = {}
+
+    def record(self, agent: str, response) -> None:
+        """Enregistre l'usage d'une réponse messages.create"""
+        usage = getattr(response, "usage", None)
+        with self._lock:
+            stats = self._stats(agent)
+            stats["calls"] += 1
+            if usage is None:
+                return
+            for field in self.FIELDS:
+                stats[field] += getattr(usage, field, None) or 0
+
+    def _stats(self, agent: str) -> dict:
+        return self._agents.setdefault(agent, dict.fromkeys(("calls",) + self.FIELDS + self.EVENTS, 0))
+
+    def count(self, agent: str, event: str) -> None:
+        """Incrémente un compteur d'événement (requête dupliquée, dégradation...)"""
+        with self._lock:
+            self._stats(agent)[event] += 1
+
+    def snapshot(self) -> dict:
+        """Retourne une copie des compteurs, avec un total tous agents confondus"""
+        with self._lock:
+            agents = {name: dict(stats) for name, stats in self._agents.items()}
+
+        total = dict.fromkeys(("calls",) + self.FIELDS + self.EVENTS, 0)
+        for stats in agents.values():
+            for key, value in stats.items():
+                total[key] += value
+
+        cacheable = total["cache_read_input_tokens"] + total["cache_creation_input_tokens"] + total["input_tokens"]
+        total["cache_hit_ratio"] = round(total["cache_read_input_tokens"] / cacheable, 3) if cacheable else 0.0
+
+        return {"agents": agents, "total": total}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._agents = {}
+
+
+llm_metrics = LLMMetrics()
+
+# Usage de la tâche asyncio courante (les compteurs globaux mélangent les tâches concurrentes)
+_usage_sink = contextvars.ContextVar("llm_usage_sink", default=None)
+
+
+@contextmanager
+def track_usage():
+    """Tokens consommés par les appels LLM faits dans ce bloc, par la tâche courante uniquement"""
+    sink = dict.fromkeys(LLMMetrics.FIELDS, 0)
+    token = _usage_sink.set(sink)
+    try:
+        yield sink
+    finally:
+        _usage_sink.reset(token)
+
+
+class DeadlineExceeded(Exception):
+    """Levée quand le budget de temps de la requête est épuisé avant la réponse du LLM"""
+
+
+class Deadline:
+    """
+    Échéance de bout en bout d'une requête, propagée de l'orchestrateur aux agents.
+    `hedge=False` désactive la duplication des appels LLM (traitement par lots :
+    le débit et le quota de tokens priment sur la latence de queue).
+    """
+
+    def __init__(self, seconds: float = None, hedge: bool = True):
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+        self.hedge = hedge
+
+    @classmethod
+    def from_env(cls) -> "Deadline":
+        """Budget configuré par REQUEST_DEADLINE_SECONDS (0 = pas d'échéance)"""
+        seconds = float(os.getenv("REQUEST_DEADLINE_SECONDS", "45"))
+        return cls(seconds if seconds > 0 else None)
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return float("inf")
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def llm_budget(self) -> float:
+        """Temps disponible pour un appel LLM, une fois la marge du rendu de secours retirée"""
+        return max(self.remaining() - FALLBACK_RESERVE_SECONDS, 0.0)
+
+    def allows(self, seconds: float) -> bool:
+        return self.llm_budget() >= seconds
+
+
+class LatencyTracker:
+    """Latences récentes des appels LLM, par agent (fenêtre glissante)"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def observe(self, agent: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(agent, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, agent: str, q: float, default: float) -> float:
+        with self._lock:
+            samples = sorted(self._samples.get(agent, ()))
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return default
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+    def hedge_delay(self, agent: str):
+        """
+        Délai avant la requête dupliquée : percentile LLM_HEDGE_PERCENTILE des latences
+        observées (LLM_HEDGE_DEFAULT_SECONDS tant que l'historique est trop court).
+        None si LLM_HEDGE_PERCENTILE=0 (pas de duplication).
+        """
+        q = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+        if q <= 0:
+            return None
+        return self.percentile(agent, q, float(os.getenv("LLM_HEDGE_DEFAULT_SECONDS", "8")))
+
+    def expected(self, agent: str) -> float:
+        """Durée médiane d'un appel : sert à décider si une tentative tient dans le budget"""
+        return self.percentile(agent, 0.5, EXPECTED_DEFAULT_SECONDS)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples = {}
+
+
+llm_latency = LatencyTracker()
+
+# Le client Anthropic est synchrone : les appels tournent dans des threads dédiés,
+# la boucle d'événements reste libre et une requête perdante peut être abandonnée.
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _llm_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_THREADS", "32")), thread_name_prefix="llm")
+        return _executor
+
+
+def _timed_create(client, agent: str, kwargs: dict, sink: dict = None):
+    start = time.perf_counter()
+    response = client.messages.create(**kwargs)
+    llm_latency.observe(agent, time.perf_counter() - start)
+    # Enregistré même pour la requête perdante : ses tokens sont facturés
+    llm_metrics.record(agent, response)
+    usage = getattr(response, "usage", None)
+    if sink is not None and usage is not None:
+        for field in LLMMetrics.FIELDS:
+            sink[field] += getattr(usage, field, None) or 0
+    return response
+
+
+async def hedged_create(client, agent: str, deadline: Deadline = None, **kwargs):
+    """
+    messages.create avec requête dupliquée : si la première n'a pas répondu au
+    percentile configuré, une seconde identique part et la première réponse gagne.
+    Lève DeadlineExceeded si aucune réponse n'arrive dans le budget de la requête.
+    """
+    loop = asyncio.get_running_loop()
+    budget = deadline.llm_budget() if deadline else None
+    if budget is not None:
+        if budget <= 0:
+            raise DeadlineExceeded(f"{agent} : budget de temps epuise")
+        if budget != float("inf"):
+            kwargs["timeout"] = budget  # Borne aussi la requête abandonnée côté client HTTP
+    start = time.monotonic()
+
+    def remaining():
+        return None if budget in (None, float("inf")) else max(budget - (time.monotonic() - start), 0.0)
+
+    executor = _llm_executor()
+    # run_in_executor ne propage pas le contexte : le compteur de la tâche est passé explicitement
+    sink = _usage_sink.get()
+    pending = {loop.run_in_executor(executor, _timed_create, client, agent, kwargs, sink)}
+    original = next(iter(pending))
+    hedge_delay = llm_latency.hedge_delay(agent) if deadline is None or deadline.hedge else None
+    hedged = False
+    last_error = None
+
+    try:
+        while pending:
+            timeout = remaining()
+            if not hedged and hedge_delay is not None:
+                wait_for = max(hedge_delay - (time.monotonic() - start), 0.0)
+                timeout = wait_for if timeout is None else min(timeout, wait_for)
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                if task.exception() is None:
+                    if task is not original:
+                        llm_metrics.count(agent, "hedge_wins")
+                    return task.result()
+                last_error = task.exception()
+
+            if not done:
+                if remaining() == 0.0:
+                    break
+                if not hedged and hedge_delay is not None:
+                    hedged = True
+                    llm_metrics.count(agent, "hedged_calls")
+                    pending.add(loop.run_in_executor(executor, _timed_create, client, agent, dict(kwargs), sink))
+    finally:
+        # Le thread de la requête perdante va au bout (borné par timeout) ; on ne l'attend plus
+        for task in pending:
+            task.cancel()
+
+    if last_error is not None and not pending:
+        raise last_error
+    raise DeadlineExceeded(f"{agent} : pas de reponse LLM dans le budget de temps")
@@ -1,22 +1,38 @@
 from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from starlette.middleware.base import BaseHTTPMiddleware
 from .orchestrator import MultiAgentOrchestrator
-from .models import GenerateVizRequest
+from .models import GenerateVizRequest, TilesRequest
+from .llm import Deadline, llm_metrics
+from .ingestion import decode_csv
+from .datasets import DatasetNotFound
+from .memory import MemoryBudgetExceeded, tune_gc
+from .profiling import PROFILE_HEADER, PROFILE_ID_HEADER, ProfilingConfig
+from contextlib import asynccontextmanager
 import traceback
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI(title="DataViz LLM API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Geler les objets du demarrage + seuils gc plus larges (remplace les gc.collect() par requete)
+    tune_gc()
+    yield
+
+app = FastAPI(title="DataViz LLM API", version="1.0.0", lifespan=lifespan)
 
 # Middleware pour desactiver le cache sur TOUTES les reponses
 class NoCacheMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         response = await call_next(request)
+        if request.method == "GET" and request.url.path.startswith("/api/tiles/") and response.status_code == 200:
+            # Contenu immuable : l'id de pyramide est un hash du dataset et des colonnes
+            response.headers["Cache-Control"] = "public, max-age=86400, immutable"
+            return response
         response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
         response.headers["Pragma"] = "no-cache"
         response.headers["Expires"] = "0"
@@ -24,6 +40,51 @@ class NoCacheMiddleware(BaseHTTPMiddleware):
 
 app.add_middleware(NoCacheMiddleware)
 
+# Profilage opt-in (echantillonnage + tracemalloc) des endpoints POST /api/*
+class ProfilingMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, config: ProfilingConfig):
+        super().__init__(app)
+        self.config = config
+
+    async def dispatch(self, request: Request, call_next):
+        # Toutes les requetes sont comptees : le profil indique combien partageaient la boucle
+        self.config.request_started()
+        try:
+            return await self._dispatch(request, call_next)
+        finally:
+            self.config.request_finished()
+
+    async def _dispatch(self, request: Request, call_next):
+        if not (request.method == "POST" and request.url.path.startswith("/api/")
+                and self.config.wants(request.headers.get(PROFILE_HEADER))):
+            return await call_next(request)
+        if not self.config.acquire():
+            # Un profil est deja en cours (tracemalloc est global) : requete non profilee
+            response = await call_next(request)
+            response.headers[PROFILE_ID_HEADER] = "busy"
+            return response
+
+        try:
+            profiler = self.config.profiler()
+            profiler.start()
+            self.config.attach(profiler)
+            try:
+                # Inclut la serialisation JSON de la reponse (faite avant l'envoi des en-tetes)
+                response = await call_next(request)
+            finally:
+                self.config.detach()
+                profiler.stop()
+            profile_id = self.config.store.save(profiler, f"{request.method} {request.url.path}")
+        finally:
+            self.config.release()
+        response.headers[PROFILE_ID_HEADER] = profile_id
+        return response
+
+profiling = ProfilingConfig.from_env()
+if profiling.enabled:
+    # Desactive : middleware absent, aucun cout par requete
+    app.add_middleware(ProfilingMiddleware, config=profiling)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -58,21 +119,26 @@ async def analyze_and_propose(
     """
     Endpoint 1 : Upload CSV + problématique → Retourne 3 propositions
     """
+    deadline = Deadline.from_env()  # Echeance de bout en bout, upload compris
     try:
         # Lire le CSV avec limite de taille
         contents = await file.read()
         if len(contents) > MAX_CSV_SIZE:
             raise HTTPException(status_code=413, detail="Fichier trop volumineux (max 10 MB)")
-        csv_data = contents.decode('utf-8')
+        # Encodage detecte (UTF-8, Windows-1252, Latin-1) au lieu de supposer UTF-8
+        csv_data, encoding = decode_csv(contents)
         del contents  # Liberer la memoire
 
         # Orchestrer Agents 1 + 2
-        result = await orchestrator.get_proposals(problem, csv_data)
+        result = await orchestrator.get_proposals(problem, csv_data, deadline=deadline)
+        result["encoding"] = encoding  # Le frontend relit le fichier avec le meme encodage
 
         return result
 
     except HTTPException:
         raise
+    except MemoryBudgetExceeded as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print("=== ERREUR /api/analyze ===")
         traceback.print_exc()
@@ -84,19 +150,104 @@ async def generate_visualization(request: GenerateVizRequest):
     """
     Endpoint 2 : Proposition choisie + CSV → Génère la visualisation
     """
+    deadline = Deadline.from_env()
     try:
+        if request.csv_data is None and request.dataset_id is None:
+            raise HTTPException(status_code=422, detail="csv_data ou dataset_id requis")
         result = await orchestrator.generate_viz(
             proposal=request.proposal.dict(),
-            csv_data=request.csv_data
+            csv_data=request.csv_data,
+            render_mode=request.render_mode,
+            dataset_id=request.dataset_id,
+            deadline=deadline
         )
         return result
 
+    except HTTPException:
+        raise
+    except DatasetNotFound:
+        raise HTTPException(status_code=404, detail="Dataset expire, renvoyez csv_data")
+
+    except MemoryBudgetExceeded as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print("=== ERREUR /api/generate ===")
         traceback.print_exc()
         print("============================")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/datasets/{dataset_id}/append")
+async def append_rows(dataset_id: str, file: UploadFile = File(...)):
+    """
+    Ajout de lignes a un dataset existant : statistiques fusionnees, caches invalides au plus juste
+    """
+    deadline = Deadline.from_env()
+    try:
+        contents = await file.read()
+        if len(contents) > MAX_CSV_SIZE:
+            raise HTTPException(status_code=413, detail="Fichier trop volumineux (max 10 MB)")
+        csv_data, _ = decode_csv(contents)
+        del contents
+
+        return await orchestrator.append_rows(dataset_id, csv_data, deadline=deadline)
+
+    except HTTPException:
+        raise
+    except DatasetNotFound:
+        raise HTTPException(status_code=404, detail="Dataset inconnu ou expire")
+    except MemoryBudgetExceeded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        print("=== ERREUR /api/datasets/append ===")
+        traceback.print_exc()
+        print("===================================")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/tiles")
+async def build_tiles(request: TilesRequest):
+    """
+    Endpoint 3 : Pyramide de tuiles (densite ou valeur moyenne) sur toutes les lignes
+    """
+    if request.csv_data is None and request.dataset_id is None:
+        raise HTTPException(status_code=422, detail="csv_data ou dataset_id requis")
+    try:
+        return await orchestrator.build_tiles(
+            csv_data=request.csv_data,
+            x=request.x,
+            y=request.y,
+            value=request.value,
+            dataset_id=request.dataset_id
+        )
+
+    except DatasetNotFound:
+        raise HTTPException(status_code=404, detail="Dataset expire, renvoyez csv_data")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except MemoryBudgetExceeded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.get("/api/tiles/{pyramid_id}/{z}/{x}/{y}.png")
+async def get_tile(pyramid_id: str, z: int, x: int, y: int):
+    """
+    Une tuile PNG de la pyramide (404 si inconnue ou expiree du cache)
+    """
+    content = orchestrator.get_tile(pyramid_id, z, x, y)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Tuile introuvable")
+    return Response(content=content, media_type="image/png")
+
+@app.get("/api/metrics")
+async def metrics():
+    """
+    Compteurs d'usage LLM (tokens d'entree/sortie, lecture/ecriture du cache de prompt),
+    etat du budget memoire et reutilisation de la bibliotheque de code
+    """
+    return {
+        "llm": llm_metrics.snapshot(),
+        "memory": orchestrator.memory.snapshot(),
+        "code_library": orchestrator.code_generator.library.snapshot()
+    }
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
\ No newline at end of file
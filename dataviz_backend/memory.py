@@ -0,0 +1,133 @@
+import asyncio
+import gc
+import os
+from contextlib import asynccontextmanager
+
+from .compaction import memory_usage_bytes
+from .ingestion import SNIFF_BYTES, read_csv
+
+COPY_FACTOR = 2  # Copies transitoires (nettoyage, compaction, échantillon)
+GC_THRESHOLDS = (50_000, 20, 100)  # Collectes gen0 moins fréquentes que (700, 10, 10)
+
+
+class MemoryBudgetExceeded(Exception):
+    """Levée quand une requête ne peut pas obtenir sa réservation mémoire"""
+
+
+def estimate_footprint(csv_data: str) -> int:
+    """
+    Estime l'empreinte d'une requête : on parse les premiers Ko, on mesure
+    memory_usage(deep=True) par caractère, puis on extrapole à tout le fichier.
+    """
+    sample = csv_data[:SNIFF_BYTES]
+    if len(csv_data) > SNIFF_BYTES and "\n" in sample:
+        sample = sample[:sample.rfind("\n")]  # Pas de ligne tronquée
+    try:
+        bytes_per_char = memory_usage_bytes(read_csv(sample)) / max(len(sample), 1)
+    except Exception:
+        bytes_per_char = 8.0  # CSV illisible : le parsing complet échouera de toute façon
+    return int(len(csv_data) * (1 + bytes_per_char * COPY_FACTOR))
+
+
+class MemoryGovernor:
+    """
+    Budget mémoire global partagé par les requêtes en cours ET les caches enregistrés
+    (tuiles, datasets). Un cache expose `nbytes`, `oldest_access()` et `evict_oldest()` :
+    sous pression, les entrées sont évincées de la moins récemment utilisée à la plus
+    récente, tous caches confondus, jusqu'à ce que la requête tienne dans le budget.
+    """
+
+    def __init__(self, budget_bytes: int, wait_timeout: float = 30.0):
+        self.budget_bytes = budget_bytes
+        self.wait_timeout = wait_timeout
+        self.reserved_bytes = 0
+        self._condition = None
+        self._caches = []
+
+    @classmethod
+    def from_env(cls) -> "MemoryGovernor":
+        """Budget configuré par MEMORY_BUDGET_MB / MEMORY_WAIT_SECONDS"""
+        return cls(
+            budget_bytes=int(os.getenv("MEMORY_BUDGET_MB", "1024")) * 2**20,
+            wait_timeout=float(os.getenv("MEMORY_WAIT_SECONDS", "30")),
+        )
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        # Créée à la demande pour être liée à la boucle d'événements courante
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    @property
+    def cache_bytes(self) -> int:
+        return sum(cache.nbytes for cache in self._caches)
+
+    @property
+    def available_bytes(self) -> int:
+        return self.budget_bytes - self.reserved_bytes - self.cache_bytes
+
+    def register_cache(self, cache) -> None:
+        """Compte un cache dans le budget ; ses entrées sont évincées sous pression mémoire"""
+        self._caches.append(cache)
+
+    def _make_room(self, nbytes: int) -> bool:
+        """Évince les entrées de cache en ordre LRU jusqu'à libérer nbytes ; True si la requête tient"""
+        if nbytes > self.budget_bytes - self.reserved_bytes:
+            # Ce sont les requêtes en cours qui bloquent : vider les caches ne suffirait pas
+            return False
+        while nbytes > self.available_bytes:
+            candidates = [(cache.oldest_access(), i) for i, cache in enumerate(self._caches)]
+            candidates = [(used, i) for used, i in candidates if used is not None]
+            if not candidates:
+                return False
+            self._caches[min(candidates)[1]].evict_oldest()
+        return True
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int, timeout: float = None):
+        """
+        Réserve nbytes dans le budget ; attend (ou rejette) si le budget est épuisé.
+        `timeout` raccourcit l'attente (échéance de la requête), sans jamais l'allonger.
+        """
+        if nbytes > self.budget_bytes:
+            raise MemoryBudgetExceeded(
+                f"Dataset trop volumineux : ~{nbytes // 2**20} Mo requis, budget {self.budget_bytes // 2**20} Mo"
+            )
+
+        async with self.condition:
+            try:
+                await asyncio.wait_for(
+                    self.condition.wait_for(lambda: self._make_room(nbytes)),
+                    timeout=self.wait_timeout if timeout is None else min(timeout, self.wait_timeout)
+                )
+            except asyncio.TimeoutError:
+                raise MemoryBudgetExceeded("Serveur sature, reessayez dans quelques instants")
+            self.reserved_bytes += nbytes
+
+        try:
+            yield nbytes
+        finally:
+            async with self.condition:
+                self.reserved_bytes -= nbytes
+                self.condition.notify_all()
+
+    def snapshot(self) -> dict:
+        return {
+            "budget_bytes": self.budget_bytes,
+            "reserved_bytes": self.reserved_bytes,
+            "cache_bytes": self.cache_bytes,
+            "available_bytes": self.available_bytes,
+        }
+
+
+def tune_gc() -> None:
+    """
+    Remplace les gc.collect() par requête : les objets chargés au démarrage
+    sont gelés (jamais re-scannés) et la génération 0 est collectée moins souvent.
+    Les DataFrames sont libérés par comptage de références dès le `del`.
+    """
+    gc.collect()
+    gc.freeze()
+    gc.set_threshold(*GC_THRESHOLDS)
+
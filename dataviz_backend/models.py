@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 class AnalysisRequest(BaseModel):
     """Requête utilisateur avec problématique + données"""
@@ -29,7 +29,17 @@ class ProposalsResponse(BaseModel):
 class GenerateVizRequest(BaseModel):
     """Requête pour générer la viz finale"""
     proposal: VizProposal
-    csv_data: str
+    csv_data: Optional[str] = None  # Optionnel si dataset_id est encore en cache serveur
+    dataset_id: Optional[str] = None
+    render_mode: Literal["image", "plotly"] = "image"  # "image" (PNG matplotlib) ou "plotly" (rendu navigateur)
+
+class TilesRequest(BaseModel):
+    """Requête pour construire une pyramide de tuiles (scatter / line volumineux)"""
+    csv_data: Optional[str] = None  # Optionnel si dataset_id est encore en cache serveur
+    dataset_id: Optional[str] = None
+    x: str
+    y: str
+    value: Optional[str] = None  # Colonne moyennée par pixel (sinon densité de points)
 
 class VizResponse(BaseModel):
     """Réponse avec le graphique"""
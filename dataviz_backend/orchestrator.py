@@ -1,7 +1,15 @@
 from .agents.data_analyst import DataAnalystAgent
 from .agents.viz_strategist import VizStrategistAgent
 from .agents.code_generator import CodeGeneratorAgent
-from .models import DataSummary, VizProposal
+from .models import DataSummary, VizProposal, VizResponse
+from .chart_specs import build_plotly_spec, resolve_columns
+from .memory import MemoryGovernor, estimate_footprint
+from .ingestion import read_csv, sniff_csv
+from .tiles import TileCache, TilePyramid, pyramid_id
+from .datasets import Dataset, DatasetNotFound, DatasetStore, chart_key, new_dataset_id, referenced_columns
+from .llm import Deadline
+from .projection import chart_columns, column_share
+import os
 
 class MultiAgentOrchestrator:
     """Orchestre les 3 agents"""
@@ -10,24 +18,193 @@ class MultiAgentOrchestrator:
         self.data_analyst = DataAnalystAgent()
         self.viz_strategist = VizStrategistAgent()
         self.code_generator = CodeGeneratorAgent()
+        self.memory = MemoryGovernor.from_env()
+        self.tiles = TileCache(max_bytes=int(os.getenv("TILE_CACHE_MB", "256")) * 2**20)
+        self.memory.register_cache(self.tiles)
+        self.datasets = DatasetStore(max_bytes=int(os.getenv("DATASET_STORE_MB", "256")) * 2**20)
+        self.memory.register_cache(self.datasets)
     
-    async def get_proposals(self, problem: str, csv_data: str) -> dict:
+    async def get_proposals(self, problem: str, csv_data: str, deadline: Deadline = None) -> dict:
         """
         Étape 1 + 2 : Analyse + Propositions
+        Le dataset est conservé côté serveur pour les ajouts de lignes (append).
+        L'échéance couvre les deux agents : ce que l'Agent 1 consomme n'est plus disponible pour l'Agent 2.
         """
-        # Agent 1 : Analyse
-        data_summary = await self.data_analyst.analyze(csv_data, problem)
-        
+        deadline = deadline or Deadline.from_env()
+        # Agent 1 : Analyse (seul agent qui charge le dataset -> réservation mémoire)
+        async with self.memory.reserve(estimate_footprint(csv_data), timeout=deadline.remaining()):
+            dataset = Dataset(new_dataset_id(), read_csv(csv_data))
+            self.datasets.put(dataset)
+            data_summary = await self._summarize(dataset, problem, deadline)
+
         # Agent 2 : Propositions
-        proposals = await self.viz_strategist.propose_visualizations(data_summary, problem)
-        
+        proposals = await self.viz_strategist.propose_visualizations(data_summary, problem, deadline)
+
         return {
+            "dataset_id": dataset.id,
             "data_summary": data_summary,
             "proposals": proposals
         }
-    
-    async def generate_viz(self, proposal: dict, csv_data: str) -> dict:
+
+    async def _summarize(self, dataset: Dataset, problem: str, deadline: Deadline = None) -> dict:
+        """Insights LLM (Agent 1) + statistiques exactes et fusionnables du dataset"""
+        data_summary = await self.data_analyst.analyze_dataframe(dataset.frame(), problem, deadline)
+        data_summary.update(dataset.summary_stats())
+        dataset.summaries[problem] = data_summary
+        return data_summary
+
+    async def append_rows(self, key: str, csv_data: str, deadline: Deadline = None) -> dict:
+        """
+        Ajoute des lignes à un dataset existant. Les statistiques sont fusionnées
+        (coût proportionnel au lot) ; seuls les caches dont les entrées ont changé
+        sont invalidés. Les insights LLM ne sont recalculés que si le schéma change.
+        """
+        dataset = self.datasets.get(key)
+        if dataset is None:
+            raise DatasetNotFound(key)
+        deadline = deadline or Deadline.from_env()
+
+        async with self.memory.reserve(estimate_footprint(csv_data), timeout=deadline.remaining()):
+            change = dataset.append(read_csv(csv_data))
+
+            stats = dataset.summary_stats()
+            regenerated = 0
+            for problem, summary in list(dataset.summaries.items()):
+                if change["schema_changed"]:
+                    await self._summarize(dataset, problem, deadline)
+                    regenerated += 1
+                else:
+                    summary.update(stats)
+
+        stale_charts = dataset.stale_charts()
+
+        return {
+            "dataset_id": dataset.id,
+            "rows": dataset.rows,
+            **change,
+            "stale_charts": stale_charts,
+            "summaries_refreshed": len(dataset.summaries) - regenerated,
+            "summaries_regenerated": regenerated,
+            "data_summaries": dataset.summaries,
+        }
+
+    async def generate_viz(self, proposal: dict, csv_data: str = None, render_mode: str = "image",
+                           dataset_id: str = None, deadline: Deadline = None) -> dict:
         """
         Étape 3 : Génération de la visualisation
+        - "image"  : code matplotlib généré par l'Agent 3, rendu PNG côté serveur
+        - "plotly" : spec Plotly déclarative sur données pré-agrégées, rendu dans le navigateur
+        Avec un dataset_id connu, le graphique est mis en cache et réutilisé tant que
+        ses colonnes n'ont pas changé.
         """
-        return await self.code_generator.generate_visualization(proposal, csv_data)
\ No newline at end of file
+        deadline = deadline or Deadline.from_env()
+        dataset = self.datasets.get(dataset_id) if dataset_id else None
+        if dataset is None:
+            if csv_data is None:
+                raise DatasetNotFound(dataset_id)
+            # Projection à la lecture : seules les colonnes du graphique sont parsées
+            dialect = sniff_csv(csv_data)
+            columns = chart_columns(proposal, dialect["columns"])
+            footprint = int(estimate_footprint(csv_data) * column_share(columns, dialect["columns"]))
+            async with self.memory.reserve(footprint, timeout=deadline.remaining()):
+                df = read_csv(csv_data, dialect, usecols=columns)
+                return await self._render(proposal, df, render_mode, deadline)
+
+        key = chart_key(proposal, render_mode)
+        entry, fresh = dataset.get_chart(key)
+        if fresh:
+            return entry["result"]
+
+        code = entry["result"].get("code", "") if entry else ""
+        columns = chart_columns(proposal, list(dataset.versions), code)
+        footprint = int(dataset.nbytes * column_share(columns, list(dataset.versions)))
+        async with self.memory.reserve(footprint, timeout=deadline.remaining()):
+            df = dataset.frame()
+            if columns is not None:
+                df = df[columns]  # Projection sur le stockage colonne : pas de copie des autres colonnes
+            result = None
+            if render_mode == "image" and code and not code.startswith("# Fallback"):
+                # Code déjà validé sur ce schéma : ré-exécution sans LLM
+                try:
+                    result = self.code_generator.rerender(code, df)
+                except Exception:
+                    result = None
+            if result is None:
+                result = await self._render(proposal, df, render_mode, deadline)
+
+        if not result.get("degraded"):
+            # Un rendu dégradé faute de temps n'est pas gardé : la requête suivante retente le LLM
+            dataset.store_chart(key, result, self._chart_columns(proposal, result, df, render_mode))
+        return result
+
+    @staticmethod
+    def _chart_columns(proposal: dict, result: dict, df, render_mode: str) -> list:
+        """Colonnes dont dépend le graphique ([] = toutes, par prudence)"""
+        if render_mode == "plotly":
+            if proposal.get("chart_type", "").lower() == "heatmap":
+                return []
+            return [c for c in resolve_columns(proposal, df) if c]
+        code = result.get("code", "")
+        if code.startswith("# Fallback"):
+            return []
+        # Colonnes citées dans le code ; aucune citée -> le code dépend de tout df
+        return referenced_columns(code, df.columns)
+
+    async def _render(self, proposal: dict, df, render_mode: str, deadline: Deadline = None) -> dict:
+        if render_mode == "plotly":
+            df = self.code_generator._clean_dataframe(df)
+            spec = build_plotly_spec(proposal, df)
+            return VizResponse(
+                plotly_json=spec,
+                code=f"# Rendu navigateur (Plotly) : {len(spec['data'])} trace(s) pre-agregee(s)"
+            ).model_dump()
+        return await self.code_generator.generate_from_dataframe(proposal, df, deadline)
+
+    async def build_tiles(self, csv_data: str = None, x: str = None, y: str = None, value: str = None,
+                          dataset_id: str = None) -> dict:
+        """
+        Pyramide de tuiles sur TOUTES les lignes (pas d'échantillon), mise en cache par dataset.
+        Avec un dataset_id connu, les colonnes sont lues dans le dataset serveur (pas de CSV à renvoyer).
+        """
+        columns = [c for c in (x, y, value) if c]
+        dataset = self.datasets.get(dataset_id) if dataset_id else None
+        if dataset is None and csv_data is None:
+            raise DatasetNotFound(dataset_id)
+
+        if dataset is not None:
+            # Versions des colonnes dans la clé : un ajout de lignes donne une nouvelle pyramide
+            versions = ",".join(f"{c}={dataset.versions.get(c)}" for c in columns)
+            key = pyramid_id(f"{dataset.id}\0{versions}", x, y, value)
+        else:
+            key = pyramid_id(csv_data, x, y, value)
+
+        pyramid = self.tiles.get(key)
+        if pyramid is None:
+            if dataset is not None:
+                missing = [c for c in columns if c not in dataset.versions]
+                if missing:
+                    raise ValueError(f"Colonnes inexistantes : {missing}")
+                footprint = int(dataset.nbytes * column_share(columns, list(dataset.versions)))
+                async with self.memory.reserve(footprint):
+                    pyramid = TilePyramid.from_dataframe(dataset.frame()[columns], x, y, value)
+            else:
+                dialect = sniff_csv(csv_data)
+                footprint = int(estimate_footprint(csv_data) * column_share(columns, dialect["columns"]))
+                async with self.memory.reserve(footprint):
+                    df = read_csv(csv_data, dialect, usecols=columns)
+                    pyramid = TilePyramid.from_dataframe(df, x, y, value)
+                    del df
+            self.tiles.put(key, pyramid)
+
+        return {
+            "pyramid_id": key,
+            "tile_url": f"/api/tiles/{key}/{{z}}/{{x}}/{{y}}.png",
+            **pyramid.describe()
+        }
+
+    def get_tile(self, key: str, z: int, x: int, y: int):
+        """PNG d'une tuile, ou None si la pyramide n'est plus en cache"""
+        pyramid = self.tiles.get(key)
+        if pyramid is None or not pyramid.has_tile(z, x, y):
+            return None
+        return pyramid.render_tile(z, x, y)
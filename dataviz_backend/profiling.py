@@ -0,0 +1,278 @@
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from pathlib import Path
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+TOP_FUNCTIONS = 20
+TOP_ALLOCATIONS = 20
+SNAPSHOT_GROWTH = 1.2  # Nouveau snapshot tracemalloc quand la mémoire tracée dépasse le pic précédent de 20 %
+SNAPSHOT_MIN_INTERVAL = 0.25  # Un snapshot coûte cher (il tient le GIL) : au plus 4 par seconde
+
+
+class SamplingProfiler:
+    """
+    Profileur par échantillonnage : un thread relève la pile du thread cible
+    toutes les `interval` secondes (sys._current_frames), sans instrumenter les appels.
+    Chaque échantillon est pondéré par le temps réellement écoulé depuis le précédent
+    (le thread d'échantillonnage attend le GIL quand le code profilé le garde).
+    Le code exécuté par exec() apparaît sous le fichier "<generated>".
+    Le thread échantillonné est celui de la boucle d'événements, partagé par toutes les
+    requêtes : `concurrent_requests` (> 1) signale des piles d'autres requêtes mêlées au profil.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005, trace_memory: bool = True):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.trace_memory = trace_memory
+        self.stacks = Counter()  # tuple de frames (racine -> feuille) -> secondes
+        self.samples = 0
+        self.duration = 0.0
+        self.peak_bytes = 0
+        self.peak_snapshot = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._owns_tracemalloc = False
+        self._snapshot_bytes = 0
+        self._snapshot_at = 0.0
+        self.concurrent_requests = 1  # Maximum de requêtes en cours pendant le profil (celle-ci comprise)
+
+    def note_concurrency(self, in_flight: int) -> None:
+        self.concurrent_requests = max(self.concurrent_requests, in_flight)
+
+    def start(self) -> None:
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._owns_tracemalloc = True
+            tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._start
+        if self.trace_memory:
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+            if self.peak_snapshot is None:
+                self.peak_snapshot = tracemalloc.take_snapshot()
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+
+    def _run(self) -> None:
+        last = self._start
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[self._stack(frame)] += now - last
+                self.samples += 1
+            last = now
+            if self.trace_memory and now - self._snapshot_at >= SNAPSHOT_MIN_INTERVAL:
+                self._maybe_snapshot()
+
+    @staticmethod
+    def _stack(frame) -> tuple:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        return tuple(reversed(stack))
+
+    def _maybe_snapshot(self) -> None:
+        """Garde le snapshot pris au plus près du pic (les allocations au pic, pas en fin de requête)"""
+        current = tracemalloc.get_traced_memory()[0]
+        if current > self._snapshot_bytes * SNAPSHOT_GROWTH:
+            self.peak_snapshot = tracemalloc.take_snapshot()
+            self._snapshot_bytes = current
+            self._snapshot_at = time.perf_counter()
+
+    def to_speedscope(self, name: str) -> dict:
+        """Format "sampled" de speedscope (https://www.speedscope.app)"""
+        frames, index = [], {}
+        samples, weights = [], []
+        for stack, seconds in self.stacks.items():
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+            samples.append([index[frame] for frame in stack])
+            weights.append(seconds)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.duration,
+                "samples": samples,
+                "weights": weights,
+            }],
+            "name": name,
+            "activeProfileIndex": 0,
+            "exporter": "dataviz_backend.profiling",
+        }
+
+    def to_folded(self) -> str:
+        """Piles repliées (flamegraph.pl, inferno, speedscope) : `a;b;c <microsecondes>`"""
+        lines = []
+        for stack, seconds in self.stacks.most_common():
+            label = ";".join(f"{name} ({Path(filename).name}:{line})" for name, filename, line in stack)
+            lines.append(f"{label} {max(round(seconds * 1e6), 1)}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        """Fonctions les plus coûteuses (temps propre et cumulé) + allocations au pic"""
+        self_time, total_time = Counter(), Counter()
+        for stack, seconds in self.stacks.items():
+            self_time[stack[-1]] += seconds
+            for frame in set(stack):
+                total_time[frame] += seconds
+
+        def top(counter):
+            return [
+                {"function": f"{name} ({filename}:{line})", "seconds": round(seconds, 4)}
+                for (name, filename, line), seconds in counter.most_common(TOP_FUNCTIONS)
+            ]
+
+        result = {
+            "duration_seconds": round(self.duration, 4),
+            "samples": self.samples,
+            "interval_seconds": self.interval,
+            "concurrent_requests": self.concurrent_requests,
+            "self_time": top(self_time),
+            "total_time": top(total_time),
+        }
+        if self.trace_memory:
+            stats = self.peak_snapshot.statistics("lineno") if self.peak_snapshot else []
+            result["memory"] = {
+                "peak_bytes": self.peak_bytes,
+                "top_allocations": [
+                    {"location": str(stat.traceback), "bytes": stat.size, "count": stat.count}
+                    for stat in stats[:TOP_ALLOCATIONS]
+                ],
+            }
+        return result
+
+
+class ProfileStore:
+    """Fichiers de profil sur disque, en ne gardant que les `retention` plus récents"""
+
+    SUFFIXES = (".speedscope.json", ".folded", ".summary.json")
+
+    def __init__(self, directory: str, retention: int = 20):
+        self.directory = Path(directory)
+        self.retention = retention
+        self._lock = threading.Lock()
+
+    def save(self, profiler: SamplingProfiler, label: str) -> str:
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", label).strip("-") or "profile"
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{uuid.uuid4().hex[:6]}"
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        base = self.directory / profile_id
+        with open(f"{base}.speedscope.json", "w", encoding="utf-8") as f:
+            json.dump(profiler.to_speedscope(label), f)
+        Path(f"{base}.folded").write_text(profiler.to_folded(), encoding="utf-8")
+        with open(f"{base}.summary.json", "w", encoding="utf-8") as f:
+            json.dump({"id": profile_id, "label": label, **profiler.summary()}, f, ensure_ascii=False, indent=2)
+
+        self._enforce_retention()
+        return profile_id
+
+    def profile_ids(self) -> list:
+        """Identifiants présents sur disque, du plus ancien au plus récent"""
+        if not self.directory.exists():
+            return []
+        summaries = sorted(self.directory.glob("*.summary.json"), key=lambda p: (p.stat().st_mtime, p.name))
+        return [p.name[:-len(".summary.json")] for p in summaries]
+
+    def _enforce_retention(self) -> None:
+        with self._lock:
+            ids = self.profile_ids()
+            for profile_id in ids[:max(len(ids) - self.retention, 0)]:
+                for suffix in self.SUFFIXES:
+                    (self.directory / f"{profile_id}{suffix}").unlink(missing_ok=True)
+
+
+class ProfilingConfig:
+    """
+    Profilage opt-in, configuré par variables d'environnement :
+    - PROFILE_TOKEN : active le profilage des requêtes portant `X-Profile: <token>`
+    - PROFILE_ALL=1 : profile toutes les requêtes (debug local uniquement)
+    - PROFILE_DIR, PROFILE_RETENTION, PROFILE_INTERVAL_MS, PROFILE_MEMORY
+    Sans PROFILE_TOKEN ni PROFILE_ALL, le middleware n'est même pas installé.
+    """
+
+    def __init__(self, token: str = None, profile_all: bool = False, directory: str = "profiles",
+                 retention: int = 20, interval: float = 0.005, trace_memory: bool = True):
+        self.token = token
+        self.profile_all = profile_all
+        self.interval = interval
+        self.trace_memory = trace_memory
+        self.store = ProfileStore(directory, retention)
+        self._busy = threading.Lock()  # tracemalloc est global : un seul profil à la fois
+        self.in_flight = 0  # Requêtes en cours (comptées sur la boucle d'événements)
+        self._active = None
+
+    @classmethod
+    def from_env(cls) -> "ProfilingConfig":
+        return cls(
+            token=os.getenv("PROFILE_TOKEN") or None,
+            profile_all=os.getenv("PROFILE_ALL", "0") == "1",
+            directory=os.getenv("PROFILE_DIR", "profiles"),
+            retention=int(os.getenv("PROFILE_RETENTION", "20")),
+            interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+            trace_memory=os.getenv("PROFILE_MEMORY", "1") == "1",
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.profile_all or self.token is not None
+
+    def wants(self, header_value: str) -> bool:
+        if self.profile_all:
+            return True
+        if self.token is None or header_value is None:
+            return False
+        # Octets : compare_digest lève TypeError sur des str non ASCII
+        return hmac.compare_digest(header_value.encode("utf-8"), self.token.encode("utf-8"))
+
+    def request_started(self) -> None:
+        self.in_flight += 1
+        if self._active is not None:
+            self._active.note_concurrency(self.in_flight)
+
+    def request_finished(self) -> None:
+        self.in_flight -= 1
+
+    def attach(self, profiler: "SamplingProfiler") -> None:
+        """Le profileur actif note les requêtes concurrentes (déjà en cours et à venir)"""
+        self._active = profiler
+        profiler.note_concurrency(self.in_flight)
+
+    def detach(self) -> None:
+        self._active = None
+
+    def acquire(self) -> bool:
+        return self._busy.acquire(blocking=False)
+
+    def release(self) -> None:
+        self._busy.release()
+
+    def profiler(self) -> SamplingProfiler:
+        """Profileur du thread courant (celui de la boucle d'événements, où tournent les agents)"""
+        return SamplingProfiler(threading.get_ident(), self.interval, self.trace_memory)
@@ -0,0 +1,23 @@
+from .datasets import referenced_columns
+
+
+def chart_columns(proposal: dict, columns: list, code: str = None):
+    """
+    Colonnes dont un graphique a besoin, dans l'ordre du dataset : les variables
+    de la proposition, plus celles citées dans le code déjà généré (AST).
+    None = pas de projection (variable absente ou inconnue : l'agent doit voir toutes les colonnes).
+    """
+    variables = proposal.get('variables', [])
+    if not variables or any(v not in columns for v in variables):
+        return None
+    needed = set(variables)
+    if code:
+        needed.update(referenced_columns(code, columns))
+    return [c for c in columns if c in needed]
+
+
+def column_share(selected, columns: list) -> float:
+    """Fraction des colonnes conservées (pour estimer la mémoire d'une lecture projetée)"""
+    if selected is None or not columns or len(set(columns)) != len(columns) or any(c not in columns for c in selected):
+        return 1.0  # Lecture complète (cf. ingestion.column_positions)
+    return len(selected) / len(columns)
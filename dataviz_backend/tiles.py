@@ -0,0 +1,211 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.image as mpimg
+import numpy as np
+import pandas as pd
+
+TILE_SIZE = 256  # Pixels par côté de tuile
+MAX_ZOOM = 3  # Niveau le plus fin : 2^3 x 2^3 tuiles de 256 px (grille 2048 x 2048)
+COLORMAP = "viridis"
+
+
+def pyramid_id(source: str, x: str, y: str, value: str = None) -> str:
+    """
+    Identifiant stable d'une pyramide (même source + mêmes colonnes -> même id).
+    `source` : contenu CSV, ou identifiant du dataset serveur et versions de ses colonnes.
+    """
+    digest = hashlib.sha1(source.encode("utf-8"))
+    digest.update(f"\0{x}\0{y}\0{value or ''}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def bin_points(x: np.ndarray, y: np.ndarray, bounds: tuple, size: int, weights: np.ndarray = None) -> np.ndarray:
+    """
+    Agrège TOUS les points dans une grille size x size (ligne 0 = y max, en haut).
+    Un seul passage O(n) via np.bincount, sans échantillonnage.
+    """
+    x_min, x_max, y_min, y_max = bounds
+    ix = ((x - x_min) / (x_max - x_min) * size).astype(np.int64)
+    iy = ((y_max - y) / (y_max - y_min) * size).astype(np.int64)
+    np.clip(ix, 0, size - 1, out=ix)
+    np.clip(iy, 0, size - 1, out=iy)
+    grid = np.bincount(iy * size + ix, weights=weights, minlength=size * size)
+    return grid.reshape(size, size).astype(np.float32)
+
+
+def _downsample(grid: np.ndarray) -> np.ndarray:
+    """Niveau de zoom inférieur : somme des blocs 2 x 2"""
+    n = grid.shape[0] // 2
+    return grid.reshape(n, 2, n, 2).sum(axis=(1, 3))
+
+
+class TilePyramid:
+    """Grilles de densité (et de valeur moyenne) multi-résolution d'un nuage de points"""
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, values: np.ndarray = None, max_zoom: int = MAX_ZOOM):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        mask = np.isfinite(x) & np.isfinite(y)
+        if values is not None:
+            values = np.asarray(values, dtype=np.float64)
+            mask &= np.isfinite(values)
+            values = values[mask]
+        x, y = x[mask], y[mask]
+        if not len(x):
+            raise ValueError("Aucun point numerique a representer")
+
+        self.rows = int(len(x))
+        self.max_zoom = max_zoom
+        self.bounds = self._bounds(x, y)
+
+        size = TILE_SIZE * 2 ** max_zoom
+        counts = bin_points(x, y, self.bounds, size)
+        sums = bin_points(x, y, self.bounds, size, weights=values) if values is not None else None
+
+        # levels[z] = (comptes, sommes) ; construit du plus fin au plus grossier
+        self.levels = [None] * (max_zoom + 1)
+        for z in range(max_zoom, -1, -1):
+            self.levels[z] = (counts, sums)
+            if z:
+                counts = _downsample(counts)
+                sums = _downsample(sums) if sums is not None else None
+
+        # Échelles de couleur globales : une même valeur a la même couleur sur toutes les tuiles
+        self.count_max = [float(np.log1p(c.max())) or 1.0 for c, _ in self.levels]
+        if values is not None:
+            self.value_range = (float(values.min()), float(values.max()))
+        else:
+            self.value_range = None
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, x: str, y: str, value: str = None) -> "TilePyramid":
+        """Construit la pyramide à partir de colonnes numériques (ou dates) du DataFrame"""
+        columns = [c for c in (x, y, value) if c]
+        missing = [c for c in columns if c not in df.columns]
+        if missing:
+            raise ValueError(f"Colonnes inexistantes : {missing}")
+
+        arrays = []
+        for col in columns:
+            series = df[col]
+            if pd.api.types.is_datetime64_any_dtype(series):
+                # Dates -> secondes depuis l'epoch ; NaT (int64 min une fois converti) -> NaN
+                seconds = series.to_numpy(dtype="datetime64[s]").astype(np.float64)
+                seconds[series.isna().to_numpy()] = np.nan
+                arrays.append(seconds)
+            elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                arrays.append(series.to_numpy(dtype=np.float64, na_value=np.nan))
+            else:
+                raise ValueError(f"La colonne '{col}' n'est pas numerique")
+
+        return cls(*arrays)
+
+    @staticmethod
+    def _bounds(x: np.ndarray, y: np.ndarray) -> tuple:
+        x_min, x_max = float(x.min()), float(x.max())
+        y_min, y_max = float(y.min()), float(y.max())
+        # Petite marge pour que le max tombe dans la dernière cellule, et éviter une largeur nulle
+        x_pad = (x_max - x_min) * 1e-6 or 0.5
+        y_pad = (y_max - y_min) * 1e-6 or 0.5
+        return (x_min - x_pad, x_max + x_pad, y_min - y_pad, y_max + y_pad)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(c.nbytes + (s.nbytes if s is not None else 0) for c, s in self.levels)
+
+    def has_tile(self, z: int, tx: int, ty: int) -> bool:
+        return 0 <= z <= self.max_zoom and 0 <= tx < 2 ** z and 0 <= ty < 2 ** z
+
+    def tile_grid(self, z: int, tx: int, ty: int) -> tuple:
+        """Sous-grilles (comptes, sommes) de TILE_SIZE x TILE_SIZE pour une tuile"""
+        counts, sums = self.levels[z]
+        rows = slice(ty * TILE_SIZE, (ty + 1) * TILE_SIZE)
+        cols = slice(tx * TILE_SIZE, (tx + 1) * TILE_SIZE)
+        return counts[rows, cols], (sums[rows, cols] if sums is not None else None)
+
+    def render_tile(self, z: int, tx: int, ty: int) -> bytes:
+        """PNG RGBA de la tuile : coût proportionnel aux pixels, pas au nombre de lignes"""
+        counts, sums = self.tile_grid(z, tx, ty)
+
+        if sums is None:
+            intensity = np.log1p(counts) / self.count_max[z]
+        else:
+            v_min, v_max = self.value_range
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means = sums / counts
+            intensity = np.nan_to_num((means - v_min) / ((v_max - v_min) or 1.0))
+
+        rgba = matplotlib.colormaps[COLORMAP](np.clip(intensity, 0.0, 1.0))
+        rgba[..., 3] = counts > 0  # Transparent là où il n'y a aucun point
+
+        buf = BytesIO()
+        mpimg.imsave(buf, rgba, format="png")
+        return buf.getvalue()
+
+    def describe(self) -> dict:
+        x_min, x_max, y_min, y_max = self.bounds
+        return {
+            "rows": self.rows,
+            "bounds": {"x_min": x_min, "x_max": x_max, "y_min": y_min, "y_max": y_max},
+            "max_zoom": self.max_zoom,
+            "tile_size": TILE_SIZE,
+            "value_range": self.value_range,
+        }
+
+
+class TileCache:
+    """Cache LRU des pyramides, borné en octets"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._last_used = {}
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(p.nbytes for p in self._items.values())
+
+    def get(self, key: str):
+        with self._lock:
+            pyramid = self._items.get(key)
+            if pyramid is not None:
+                self._items.move_to_end(key)
+                self._last_used[key] = time.monotonic()
+            return pyramid
+
+    def put(self, key: str, pyramid: TilePyramid) -> None:
+        with self._lock:
+            self._items[key] = pyramid
+            self._items.move_to_end(key)
+            self._last_used[key] = time.monotonic()
+            total = sum(p.nbytes for p in self._items.values())
+            while total > self.max_bytes and len(self._items) > 1:
+                total -= self._pop_oldest()
+
+    def oldest_access(self):
+        """Date du dernier accès à l'entrée la plus ancienne (None si vide)"""
+        with self._lock:
+            return self._last_used[next(iter(self._items))] if self._items else None
+
+    def evict_oldest(self) -> int:
+        """Évince l'entrée la moins récemment utilisée ; retourne les octets libérés"""
+        with self._lock:
+            return self._pop_oldest() if self._items else 0
+
+    def _pop_oldest(self) -> int:
+        key, evicted = self._items.popitem(last=False)
+        del self._last_used[key]
+        return evicted.nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._last_used.clear()
@@ -4,6 +4,9 @@ import pandas as pd
 from io import StringIO
 from dataviz_backend.models import VizProposal, GenerateVizRequest, DataSummary
 from dataviz_backend.agents.code_generator import CodeGeneratorAgent
+from dataviz_backend.llm import LLMMetrics, cached_system
+from dataviz_backend.compaction import compact_dataframe
+from dataviz_backend.chart_specs import build_plotly_spec, resolve_columns
 
 
 # === Tests des modeles Pydantic ===
@@ -60,6 +63,68 @@ def test_data_summary_valid():
     assert summary.correlations is None
 
 
+# === Tests du prompt caching et des metriques LLM ===
+
+def test_cached_system_marks_cache_control():
+    """Test que le prefixe system est marque pour le cache."""
+    blocks = cached_system("regles")
+    assert blocks == [{"type": "text", "text": "regles", "cache_control": {"type": "ephemeral"}}]
+
+
+def test_llm_metrics_aggregates_cache_tokens():
+    """Test que LLMMetrics agrege les tokens de cache par agent."""
+    from types import SimpleNamespace
+
+    metrics = LLMMetrics()
+    usage = SimpleNamespace(
+        input_tokens=100, output_tokens=20,
+        cache_creation_input_tokens=0, cache_read_input_tokens=300
+    )
+    metrics.record("code_generator", SimpleNamespace(usage=usage))
+    metrics.record("code_generator", SimpleNamespace())  # reponse sans usage
+    snapshot = metrics.snapshot()
+    assert snapshot["agents"]["code_generator"]["calls"] == 2
+    assert snapshot["total"]["cache_read_input_tokens"] == 300
+    assert snapshot["total"]["cache_hit_ratio"] == 0.75
+
+
+# === Tests de la compaction memoire ===
+
+def test_compact_dataframe_reduces_memory():
+    """Test que la compaction convertit les types et reduit la memoire."""
+    df = pd.DataFrame({
+        "region": ["Nord", "Sud", "Est", "Ouest"] * 250,
+        "quantite": list(range(1000)),
+        "prix": [0.5, 1.25, 2.0, 3.75] * 250,
+    })
+    compacted, report = compact_dataframe(df, compact_ints=True)
+    assert isinstance(compacted["region"].dtype, pd.CategoricalDtype)
+    assert compacted["quantite"].dtype == "int32"
+    assert compacted["prix"].dtype == "float32"
+    assert report["after_bytes"] < report["before_bytes"]
+
+
+def test_compact_dataframe_is_lossless():
+    """Test que la compaction ne perd pas de precision."""
+    df = pd.DataFrame({
+        "mesure": [0.1, 0.2, None],
+        "grand": [2**40, 1, 2],
+        "id": ["a", "b", "c"],
+    })
+    compacted, _ = compact_dataframe(df, compact_ints=True)
+    assert compacted["mesure"].dtype == "float64"  # 0.1 non representable en float32
+    assert compacted["grand"].dtype == "int64"
+    pd.testing.assert_frame_equal(compacted.astype(object), df.astype(object))
+
+
+def test_compact_dataframe_keeps_int64_by_default():
+    """Test que les entiers restent en int64 pour le code genere (pas de debordement)."""
+    df = pd.DataFrame({"prix": [150000, 2], "quantite": [20000, 3]})
+    compacted, _ = compact_dataframe(df)
+    assert compacted["prix"].dtype == "int64"
+    assert (compacted["prix"] * compacted["quantite"]).iloc[0] == 3_000_000_000
+
+
 # === Tests du CodeGeneratorAgent (methodes utilitaires) ===
 
 class TestCodeGeneratorUtils:
@@ -128,6 +193,14 @@ class TestCodeGeneratorUtils:
         assert "produit" in prompt
         assert "ventes" in prompt
 
+    def test_build_prompt_excludes_static_rules(self):
+        """Test que les regles statiques sont dans le prefixe system, pas dans le prompt."""
+        df = pd.DataFrame({"a": [1]})
+        proposal = {"title": "Test", "chart_type": "bar", "variables": ["a"]}
+        prompt = self.agent._build_prompt(proposal, df)
+        assert "RÈGLES OBLIGATOIRES" not in prompt
+        assert "RÈGLES OBLIGATOIRES" in self.agent.SYSTEM_PROMPT
+
     def test_build_prompt_warns_invalid_columns(self):
         """Test que _build_prompt avertit des colonnes invalides."""
         df = pd.DataFrame({"a": [1], "b": [2]})
@@ -140,14 +213,6 @@ class TestCodeGeneratorUtils:
         assert "N'EXISTENT PAS" in prompt
         assert "colonne_inexistante" in prompt
 
-    def test_build_prompt_includes_retry_info(self):
-        """Test que _build_prompt inclut l'erreur precedente en retry."""
-        df = pd.DataFrame({"a": [1]})
-        proposal = {"title": "Test", "chart_type": "bar", "variables": ["a"]}
-        prompt = self.agent._build_prompt(proposal, df, error_msg="KeyError: 'x'")
-        assert "KeyError" in prompt
-        assert "ÉCHOUÉ" in prompt
-
     def test_execute_and_capture_returns_base64(self):
         """Test que _execute_and_capture retourne une image base64."""
         import matplotlib
@@ -158,6 +223,29 @@ class TestCodeGeneratorUtils:
         assert isinstance(result, str)
         assert len(result) > 1000  # Image non vide
 
+    def test_prepared_dataframe_supports_autre_grouping(self):
+        """Test que le regroupement "Autre" (regle 5) et l'arithmetique marchent sur le DataFrame prepare."""
+        df = pd.DataFrame({
+            "categorie": [f"c{i % 12}" for i in range(600)],
+            "prix": [103550.0625, 0.5, 2.25] * 200,
+            "quantite": [29990.0, 1.0, 2.0] * 200,
+        })
+        prepared, _ = self.agent._prepare_dataframe(df)
+        assert not isinstance(prepared["categorie"].dtype, pd.CategoricalDtype)
+        assert prepared["prix"].dtype == "float64"
+        assert (prepared["prix"] * prepared["quantite"]).iloc[0] == 103550.0625 * 29990.0
+
+        code = (
+            "s = df['categorie']\n"
+            "top = s.value_counts().head(7).index\n"
+            "s = s.where(s.isin(top), 'Autre')\n"
+            "agg = df.assign(categorie=s).groupby('categorie')['prix'].sum()\n"
+            "plt.figure(figsize=(8, 8))\n"
+            "plt.pie(agg.values, labels=agg.index)\n"
+            "plt.title('Parts')"
+        )
+        assert len(self.agent._execute_and_capture(code, prepared)) > 1000
+
     def test_execute_and_capture_fails_on_empty(self):
         """Test que _execute_and_capture echoue si pas de graphique."""
         df = pd.DataFrame({"x": [1]})
@@ -197,3 +285,122 @@ class TestCodeGeneratorUtils:
         result = self.agent._build_fallback(proposal, df)
         assert isinstance(result, str)
         assert len(result) > 1000
+
+    def test_describe_error_extracts_line_and_column(self):
+        """Test que _describe_error localise la ligne et la colonne fautive."""
+        df = pd.DataFrame({"x": [1, 2]})
+        code = "plt.figure()\nplt.bar(df['x'], df['inexistante'])"
+        with pytest.raises(KeyError) as exc_info:
+            self.agent._execute_and_capture(code, df)
+        info = self.agent._describe_error(exc_info.value, code, df)
+        assert info["type"] == "KeyError"
+        assert info["line"] == 2
+        assert "inexistante" in info["line_code"]
+        assert info["column"] == "inexistante"
+
+    def test_apply_patch_replaces_block(self):
+        """Test que _apply_patch applique un bloc SEARCH/REPLACE."""
+        code = "plt.figure()\nplt.bar(df['X'], df['y'])"
+        patch = (
+            "<<<<<<< SEARCH\n"
+            "plt.bar(df['X'], df['y'])\n"
+            "=======\n"
+            "plt.bar(df['x'], df['y'])\n"
+            ">>>>>>> REPLACE"
+        )
+        patched = self.agent._apply_patch(code, patch)
+        assert patched == "plt.figure()\nplt.bar(df['x'], df['y'])"
+
+    def test_apply_patch_rejects_unknown_block(self):
+        """Test que _apply_patch echoue si le bloc SEARCH est introuvable."""
+        patch = "<<<<<<< SEARCH\nabsent\n=======\nautre\n>>>>>>> REPLACE"
+        with pytest.raises(ValueError, match="inapplicable"):
+            self.agent._apply_patch("plt.figure()", patch)
+
+    def test_apply_patch_accepts_full_code(self):
+        """Test que _apply_patch accepte un programme complet sans patch."""
+        patched = self.agent._apply_patch("ancien", "```python\nplt.figure()\n```")
+        assert patched == "plt.figure()"
+
+    @pytest.mark.asyncio
+    async def test_generate_visualization_repairs_with_patch(self):
+        """Test que la 2e tentative envoie le code precedent et applique un patch."""
+        from types import SimpleNamespace
+
+        replies = [
+            "plt.figure()\nplt.bar(df['produit'], df['Ventes'])",
+            "<<<<<<< SEARCH\ndf['Ventes']\n=======\ndf['ventes']\n>>>>>>> REPLACE",
+        ]
+        calls = []
+
+        def fake_create(**kwargs):
+            calls.append(kwargs["messages"])
+            text = replies[len(calls) - 1]
+            return SimpleNamespace(content=[SimpleNamespace(text=text)])
+
+        self.agent.client = SimpleNamespace(messages=SimpleNamespace(create=fake_create))
+        proposal = {"title": "Ventes", "chart_type": "bar", "variables": ["produit", "ventes"]}
+        result = await self.agent.generate_visualization(proposal, "produit,ventes\nA,1\nB,2\n")
+
+        assert len(calls) == 2
+        assert calls[1][1] == {"role": "assistant", "content": replies[0]}
+        assert "Ventes" in calls[1][2]["content"]
+        assert result["code"] == "plt.figure()\nplt.bar(df['produit'], df['ventes'])"
+        assert len(result["image_base64"]) > 1000
+
+
+# === Tests des specs Plotly (rendu navigateur) ===
+
+class TestPlotlySpecs:
+    """Tests de la construction des specs Plotly pre-agregees."""
+
+    def setup_method(self):
+        self.df = pd.DataFrame({
+            "region": ["Nord", "Sud", "Est", "Ouest", "Nord", "Sud"] * 5,
+            "ventes": list(range(30)),
+            "prix": [float(i) / 2 for i in range(30)],
+        })
+
+    def test_resolve_columns_ignores_unknown_variables(self):
+        """Test que les variables inexistantes sont ignorees."""
+        proposal = {"chart_type": "bar", "variables": ["inexistante", "ventes"]}
+        assert resolve_columns(proposal, self.df) == ("region", "ventes")
+
+    def test_bar_spec_is_aggregated(self):
+        """Test que le bar chart contient une barre par categorie."""
+        spec = build_plotly_spec({"title": "Ventes", "chart_type": "bar", "variables": ["region", "ventes"]}, self.df)
+        trace = spec["data"][0]
+        assert trace["type"] == "bar"
+        assert len(trace["x"]) == 4
+        assert sum(trace["y"]) == sum(range(30))
+        assert spec["layout"]["title"]["text"] == "Ventes"
+
+    def test_scatter_spec_uses_numeric_axes(self):
+        """Test que le scatter utilise deux colonnes numeriques."""
+        spec = build_plotly_spec({"title": "S", "chart_type": "scatter", "variables": ["prix", "ventes"]}, self.df)
+        trace = spec["data"][0]
+        assert trace["type"] == "scattergl"
+        assert len(trace["x"]) == 30
+
+    def test_axis_values_keep_full_precision(self):
+        """Test que les positions sur les axes ne sont pas arrondies (pression entre 1013 et 1014)."""
+        df = pd.DataFrame({"pression": [1013.12, 1013.47, 1013.81, 1013.25], "temp": [12.5, 13.0, 14.25, 11.0]})
+        scatter = build_plotly_spec({"chart_type": "scatter", "variables": ["pression", "temp"]}, df)["data"][0]
+        assert scatter["x"] == df["pression"].tolist()
+        histogram = build_plotly_spec({"chart_type": "histogram", "variables": ["pression"]}, df)["data"][0]
+        assert len(set(histogram["x"])) == len(histogram["x"])
+        assert 1013.12 < histogram["x"][0] < histogram["x"][-1] < 1013.81
+
+    def test_box_spec_precomputes_quartiles(self):
+        """Test que le box plot n'envoie que les quartiles."""
+        spec = build_plotly_spec({"title": "B", "chart_type": "box", "variables": ["region", "ventes"]}, self.df)
+        trace = spec["data"][0]
+        assert "y" not in trace
+        assert len(trace["median"]) == 4
+
+    def test_spec_is_json_serializable(self):
+        """Test que toutes les specs sont serialisables en JSON."""
+        import json
+        for chart_type in ["bar", "scatter", "pie", "box", "line", "histogram", "heatmap"]:
+            proposal = {"title": "T", "chart_type": chart_type, "variables": ["region", "ventes"]}
+            json.dumps(build_plotly_spec(proposal, self.df))
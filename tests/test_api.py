@@ -89,3 +89,163 @@ async def test_generate_invalid_body():
             json={"wrong_field": "test"}
         )
     assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_metrics_exposes_cache_tokens():
+    """Test que /api/metrics expose les tokens de cache du prompt."""
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/api/metrics")
+    assert response.status_code == 200
+    total = response.json()["llm"]["total"]
+    assert "cache_read_input_tokens" in total
+    assert "cache_creation_input_tokens" in total
+
+
+@pytest.mark.asyncio
+async def test_tiles_build_and_serve(sample_csv):
+    """Test que /api/tiles construit la pyramide et sert les tuiles PNG."""
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/api/tiles",
+            json={"csv_data": sample_csv, "x": "prix", "y": "ventes"}
+        )
+        assert response.status_code == 200
+        info = response.json()
+        assert info["rows"] == 5
+
+        tile_url = info["tile_url"].format(z=0, x=0, y=0)
+        tile = await client.get(tile_url)
+        missing = await client.get(info["tile_url"].format(z=9, x=0, y=0))
+
+    assert tile.status_code == 200
+    assert tile.headers["content-type"] == "image/png"
+    assert "immutable" in tile.headers["cache-control"]
+    assert missing.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_tiles_from_server_dataset(sample_csv):
+    """Test que /api/tiles accepte un dataset_id sans csv_data, et retourne 404 s'il a expire."""
+    import pandas as pd
+    from io import StringIO
+    from dataviz_backend import main
+    from dataviz_backend.datasets import Dataset
+
+    main.orchestrator.datasets.put(Dataset("tuiles", pd.read_csv(StringIO(sample_csv))))
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post("/api/tiles", json={"dataset_id": "tuiles", "x": "prix", "y": "ventes"})
+        expired = await client.post("/api/tiles", json={"dataset_id": "inconnu", "x": "prix", "y": "ventes"})
+        empty = await client.post("/api/tiles", json={"x": "prix", "y": "ventes"})
+
+    assert response.status_code == 200
+    assert response.json()["rows"] == 5
+    assert expired.status_code == 404
+    assert empty.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_tiles_rejects_text_column(sample_csv):
+    """Test que /api/tiles retourne 400 pour une colonne non numerique."""
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/api/tiles",
+            json={"csv_data": sample_csv, "x": "produit", "y": "ventes"}
+        )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_generate_plotly_mode_returns_spec(sample_csv):
+    """Test que le mode plotly retourne une spec sans appel LLM ni image."""
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/api/generate",
+            json={
+                "proposal": {
+                    "title": "Ventes par produit",
+                    "chart_type": "bar",
+                    "variables": ["produit", "ventes"],
+                    "justification": "Comparer",
+                    "best_practices": "Tri decroissant"
+                },
+                "csv_data": sample_csv,
+                "render_mode": "plotly"
+            }
+        )
+    assert response.status_code == 200
+    body = response.json()
+    assert "image_base64" not in body
+    assert body["plotly_json"]["data"][0]["x"][0] == "D"
+
+
+@pytest.mark.asyncio
+async def test_append_unknown_dataset_returns_404():
+    """Test que l'ajout a un dataset inconnu retourne 404."""
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/api/datasets/inconnu/append",
+            files={"file": ("ajout.csv", b"a,b\n1,2", "text/csv")}
+        )
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_generate_unknown_dataset_returns_404():
+    """Test qu'un dataset_id expire sans csv_data retourne 404."""
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/api/generate",
+            json={
+                "proposal": {"title": "T", "chart_type": "bar", "variables": ["produit", "ventes"],
+                             "justification": "j", "best_practices": "b"},
+                "dataset_id": "inconnu",
+                "render_mode": "plotly"
+            }
+        )
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_generate_render_key_error_is_not_404(sample_csv, monkeypatch):
+    """Test qu'un KeyError pendant le rendu reste une erreur serveur, pas un dataset expire."""
+    from dataviz_backend import main
+
+    async def broken_render(*args, **kwargs):
+        raise KeyError("colonne")
+
+    monkeypatch.setattr(main.orchestrator, "_render", broken_render)
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/api/generate",
+            json={
+                "proposal": {"title": "T", "chart_type": "bar", "variables": ["produit", "ventes"],
+                             "justification": "j", "best_practices": "b"},
+                "csv_data": sample_csv,
+                "render_mode": "plotly"
+            }
+        )
+    assert response.status_code == 500
+
+
+@pytest.mark.asyncio
+async def test_generate_requires_csv_or_dataset():
+    """Test que /api/generate exige csv_data ou dataset_id."""
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/api/generate",
+            json={"proposal": {
+                "title": "T", "chart_type": "bar", "variables": ["a"],
+                "justification": "j", "best_practices": "b"
+            }}
+        )
+    assert response.status_code == 422
@@ -0,0 +1,166 @@
+"""Tests pour le traitement par lots (CLI)."""
+import asyncio
+import base64
+import io
+import json
+import multiprocessing
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from dataviz_backend import batch
+from dataviz_backend.datasets import Dataset, DatasetStore
+
+
+class FakeOrchestrator:
+    """Orchestrateur sans LLM : 2 propositions, une image factice par graphique."""
+
+    def __init__(self):
+        agent = SimpleNamespace(client=SimpleNamespace(messages=None))
+        self.data_analyst = self.viz_strategist = self.code_generator = agent
+        self.memory = SimpleNamespace(budget_bytes=800)
+        self.datasets = DatasetStore(max_bytes=400)
+        self.tiles = SimpleNamespace(max_bytes=200)
+
+    async def get_proposals(self, problem, csv_data, deadline=None):
+        self.deadline = deadline
+        if "echec" in problem:
+            raise ValueError("echec simule")
+        self.datasets.put(Dataset("ds", pd.read_csv(io.StringIO(csv_data))))
+        proposals = [{"title": "A", "chart_type": "bar"}, {"title": "B", "chart_type": "pie"}]
+        return {"dataset_id": "ds", "data_summary": {"insights": "ok"}, "proposals": proposals}
+
+    async def generate_viz(self, proposal, csv_data, render_mode="image", dataset_id=None, deadline=None):
+        return {"image_base64": base64.b64encode(b"png").decode(), "code": "plt.figure()"}
+
+
+class DegradedOrchestrator(FakeOrchestrator):
+    """Le second graphique retombe sur le rendu de secours."""
+
+    async def generate_viz(self, proposal, csv_data, render_mode="image", dataset_id=None, deadline=None):
+        result = await super().generate_viz(proposal, csv_data, render_mode, dataset_id, deadline)
+        return {**result, "degraded": proposal["title"] == "B"}
+
+
+class SlowOrchestrator(FakeOrchestrator):
+    """Chaque analyse attend un "appel LLM" : mesure le nombre de taches en vol."""
+
+    in_flight = peak = 0
+
+    async def get_proposals(self, problem, csv_data, deadline=None):
+        SlowOrchestrator.in_flight += 1
+        SlowOrchestrator.peak = max(SlowOrchestrator.peak, SlowOrchestrator.in_flight)
+        try:
+            await asyncio.sleep(0.05)
+            return await super().get_proposals(problem, csv_data, deadline)
+        finally:
+            SlowOrchestrator.in_flight -= 1
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    (tmp_path / "ventes.csv").write_text("produit,ventes\nA,1\nB,2\n", encoding="utf-8")
+    path = tmp_path / "manifest.csv"
+    path.write_text(
+        "csv_path,problem\n"
+        "ventes.csv,Quel produit vend le plus ?\n"
+        "ventes.csv,echec attendu\n",
+        encoding="utf-8"
+    )
+    return path
+
+
+def test_load_manifest_assigns_stable_ids(manifest):
+    """Test que chaque tache a un identifiant stable et un chemin absolu."""
+    jobs = batch.load_manifest(manifest)
+    assert len(jobs) == 2
+    assert jobs[0]["job_id"].startswith("ventes-")
+    assert jobs[0]["job_id"] != jobs[1]["job_id"]
+    assert jobs == batch.load_manifest(manifest)
+
+
+def test_run_batch_writes_outputs_and_resumes(manifest, tmp_path, monkeypatch):
+    """Test que le lot ecrit les sorties, le checkpoint, puis reprend sans refaire."""
+    monkeypatch.setattr(batch, "MultiAgentOrchestrator", FakeOrchestrator)
+    jobs = batch.load_manifest(manifest)
+    output = tmp_path / "out"
+
+    report = batch.run_batch(jobs, str(output), workers=1, max_charts=2)
+    assert report["ok"] == 1
+    assert report["failed"] == 1
+    assert report["charts"] == 2
+
+    job_dir = output / jobs[0]["job_id"]
+    assert (job_dir / "chart_1.png").read_bytes() == b"png"
+    assert (job_dir / "chart_2.py").read_text() == "plt.figure()"
+    assert json.loads((job_dir / "summary.json").read_text())["data_summary"]["insights"] == "ok"
+
+    # Le dataset de la tache est libere une fois ses graphiques ecrits
+    assert batch._orchestrator.datasets.get("ds") is None
+
+    # Reprise : seule la tache en echec est relancee
+    report = batch.run_batch(jobs, str(output), workers=1, max_charts=2)
+    assert report["skipped"] == 1
+    assert report["jobs"] == 1
+
+
+def test_worker_budgets_are_split_across_processes(monkeypatch):
+    """Test que les budgets memoire de la machine sont partages entre les workers."""
+    monkeypatch.setattr(batch, "MultiAgentOrchestrator", FakeOrchestrator)
+    batch._worker_init(None, workers=4)
+    assert batch._orchestrator.memory.budget_bytes == 200
+    assert batch._orchestrator.datasets.max_bytes == 100
+    assert batch._orchestrator.tiles.max_bytes == 50
+
+
+def test_batch_has_no_deadline_and_retries_degraded_jobs(manifest, tmp_path, monkeypatch):
+    """Test que le lot tourne sans echeance ni duplication et relance les taches degradees."""
+    monkeypatch.setattr(batch, "MultiAgentOrchestrator", DegradedOrchestrator)
+    jobs = batch.load_manifest(manifest)[:1]
+    output = tmp_path / "out"
+
+    report = batch.run_batch(jobs, str(output), workers=1, max_charts=2)
+    assert report["degraded"] == 1 and report["ok"] == 0 and report["failed"] == 0
+    deadline = batch._orchestrator.deadline
+    assert deadline.remaining() == float("inf")
+    assert deadline.hedge is False
+
+    record = json.loads((output / batch.PROGRESS_FILE).read_text().splitlines()[-1])
+    assert record["status"] == "degraded"
+    assert record["degraded_charts"] == 1
+    assert batch.run_batch(jobs, str(output), workers=1, max_charts=2)["skipped"] == 0
+
+
+@pytest.fixture
+def big_manifest(tmp_path):
+    (tmp_path / "ventes.csv").write_text("produit,ventes\nA,1\nB,2\n", encoding="utf-8")
+    path = tmp_path / "manifest.jsonl"
+    path.write_text("".join(
+        json.dumps({"csv_path": "ventes.csv", "problem": f"question {i}"}) + "\n" for i in range(8)
+    ), encoding="utf-8")
+    return path
+
+
+def test_worker_runs_several_jobs_at_once(big_manifest, tmp_path, monkeypatch):
+    """Test qu'un meme processus a plusieurs taches en vol (au-dela du nombre de workers)."""
+    monkeypatch.setattr(batch, "MultiAgentOrchestrator", SlowOrchestrator)
+    SlowOrchestrator.peak = 0
+    report = batch.run_batch(batch.load_manifest(big_manifest), str(tmp_path / "out"), workers=1, llm_concurrency=4)
+    assert report["ok"] == 8
+    assert SlowOrchestrator.peak == 4
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                    reason="l'orchestrateur factice n'est herite que par fork")
+def test_run_batch_with_process_pool(big_manifest, tmp_path, monkeypatch):
+    """Test du chemin multi-processus : chaque tache est executee une fois et checkpointee."""
+    monkeypatch.setattr(batch, "MultiAgentOrchestrator", SlowOrchestrator)
+    jobs = batch.load_manifest(big_manifest)
+    output = tmp_path / "out"
+
+    report = batch.run_batch(jobs, str(output), workers=2, llm_concurrency=4, max_charts=1)
+    assert report["ok"] == 8 and report["charts"] == 8
+    records = [json.loads(line) for line in (output / batch.PROGRESS_FILE).read_text().splitlines()]
+    assert sorted(r["job_id"] for r in records) == sorted(j["job_id"] for j in jobs)
+    assert all((output / j["job_id"] / "chart_1.png").exists() for j in jobs)
+    assert batch.run_batch(jobs, str(output), workers=2)["skipped"] == 8
@@ -0,0 +1,95 @@
+"""Tests pour la bibliotheque de code reutilisable (indexee par schema)."""
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from dataviz_backend.agents.code_generator import CodeGeneratorAgent
+from dataviz_backend.code_library import CodeLibrary, retitle, schema_signature
+
+PROPOSAL = {"title": "Ventes par produit", "chart_type": "bar", "variables": ["produit", "ventes"]}
+CODE = "plt.figure(figsize=(12, 7))\nplt.bar(df['produit'], df['ventes'])\nplt.title('Ventes par produit')"
+
+
+def test_signature_ignores_rows_but_not_schema():
+    """Test que la signature depend du schema et de la proposition, pas des lignes."""
+    week1 = pd.DataFrame({"produit": ["A", "B"], "ventes": [1, 2]})
+    week2 = pd.DataFrame({"produit": ["C", "D", "E"], "ventes": [3.5, None, 1.0]})
+    renamed = week1.rename(columns={"ventes": "montant"})
+
+    assert schema_signature(week1, PROPOSAL) == schema_signature(week2, PROPOSAL)
+    assert schema_signature(week1, PROPOSAL) != schema_signature(renamed, PROPOSAL)
+    assert schema_signature(week1, PROPOSAL) != schema_signature(week1, {**PROPOSAL, "chart_type": "pie"})
+
+
+def test_retitle_only_touches_the_title_argument():
+    """Test que seul l'argument de plt.title est remplace, pas les colonnes ou etiquettes homonymes."""
+    code = (
+        "agg = df.groupby('région')['Ventes'].sum()\n"
+        "plt.bar(agg.index, agg.values, label='Ventes')\n"
+        "plt.title('Ventes', fontsize=16)"
+    )
+    retitled = retitle(code, "Ventes", "Chiffre d'affaires")
+    assert "df.groupby('région')['Ventes']" in retitled
+    assert "label='Ventes'" in retitled
+    assert "plt.title(\"Chiffre d'affaires\", fontsize=16)" in retitled
+    compile(retitled, "<test>", "exec")
+
+
+def test_retitle_leaves_unparsable_or_dynamic_titles():
+    """Test qu'un titre construit dynamiquement ou un code invalide n'est pas modifie."""
+    assert retitle("plt.title(f'Semaine {n}')", "Semaine 1", "Semaine 2") == "plt.title(f'Semaine {n}')"
+    assert retitle("plt.title('Semaine 1'", "Semaine 1", "Semaine 2") == "plt.title('Semaine 1'"
+
+
+def test_failing_entries_are_evicted():
+    """Test qu'une entree qui echoue de facon repetee est evincee."""
+    library = CodeLibrary()
+    library.record_success("sig", "code_a")
+    library.record_failure("sig", "code_a")
+    assert library.candidates("sig")
+    library.record_failure("sig", "code_a")
+
+    assert library.candidates("sig") == []
+    assert library.snapshot()["evictions"] == 1
+
+
+def test_candidates_ordered_by_success_rate():
+    """Test que le code le plus fiable est essaye en premier."""
+    library = CodeLibrary()
+    library.record_success("sig", "fragile")
+    library.record_failure("sig", "fragile")
+    library.record_success("sig", "fiable")
+    assert [c["code"] for c in library.candidates("sig")] == ["fiable", "fragile"]
+
+
+def test_library_persists_to_disk(tmp_path):
+    """Test que la bibliotheque survit a un redemarrage (CODE_LIBRARY_PATH)."""
+    path = str(tmp_path / "library.json")
+    CodeLibrary(path).record_success("sig", CODE, "Titre")
+    assert CodeLibrary(path).candidates("sig")[0]["code"] == CODE
+
+
+@pytest.mark.asyncio
+async def test_same_schema_skips_llm():
+    """Test qu'un nouvel export au meme schema reutilise le code sans appel LLM."""
+    agent = CodeGeneratorAgent()
+    calls = []
+
+    def fake_create(**kwargs):
+        calls.append(kwargs)
+        return SimpleNamespace(content=[SimpleNamespace(text=CODE)])
+
+    agent.client = SimpleNamespace(messages=SimpleNamespace(create=fake_create))
+
+    first = await agent.generate_visualization(PROPOSAL, "produit,ventes\nA,1\nB,2\n")
+    second = await agent.generate_visualization(
+        {**PROPOSAL, "title": "Ventes semaine 2"}, "produit,ventes\nC,5\nD,7\nE,1\n"
+    )
+
+    assert len(calls) == 1
+    assert "reused" not in first
+    assert second["reused"] is True
+    assert "Ventes semaine 2" in second["code"]
+    assert len(second["image_base64"]) > 1000
+    assert agent.library.snapshot()["hits"] == 1
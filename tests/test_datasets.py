@@ -0,0 +1,179 @@
+"""Tests pour les datasets serveur (ajout incremental de lignes)."""
+import numpy as np
+import pandas as pd
+import pytest
+from dataviz_backend.compaction import HAS_PYARROW
+from dataviz_backend.datasets import Dataset, DatasetStore, MergeableStats, chart_key, column_kind, referenced_columns
+from dataviz_backend.ingestion import read_csv
+
+
+@pytest.fixture
+def frames():
+    rng = np.random.default_rng(0)
+    def make(n, offset):
+        return pd.DataFrame({
+            "region": rng.choice(["Nord", "Sud", "Est"], n),
+            "ventes": rng.integers(0, 1000, n) + offset,
+            "prix": rng.normal(50, 10, n).round(2),
+        })
+    return make(300, 0), make(100, 500)
+
+
+def test_mergeable_stats_match_full_recompute(frames):
+    """Test que les stats fusionnees egalent celles calculees sur tout le dataset."""
+    first, second = frames
+    stats = MergeableStats()
+    stats.update(first)
+    stats.update(second)
+
+    full = pd.concat([first, second], ignore_index=True)
+    assert stats.numeric_stats()["ventes"]["mean"] == round(full["ventes"].mean(), 2)
+    assert stats.numeric_stats()["prix"]["max"] == round(full["prix"].max(), 2)
+    assert stats.correlations()["ventes"]["prix"] == round(full[["ventes", "prix"]].corr().iloc[0, 1], 2)
+    assert stats.category_counts()["region"] == full["region"].value_counts().to_dict()
+
+
+def test_append_updates_rows_and_versions(frames):
+    """Test que l'ajout met a jour les lignes et les versions de colonnes modifiees."""
+    first, second = frames
+    dataset = Dataset("d", first)
+    second = second.assign(prix=np.nan)
+
+    change = dataset.append(second)
+    assert change["appended"] == 100
+    assert change["schema_changed"] is False
+    assert "prix" not in change["changed_columns"]
+    assert dataset.rows == 400
+    assert len(dataset.frame()) == 400
+    assert isinstance(dataset.frame()["region"].dtype, pd.CategoricalDtype)
+
+
+def test_append_invalidates_only_affected_charts(frames):
+    """Test que seuls les graphiques dont une colonne a change sont perimes."""
+    first, second = frames
+    dataset = Dataset("d", first)
+    dataset.store_chart("ventes", {"code": "..."}, ["region", "ventes"])
+    dataset.store_chart("prix", {"code": "..."}, ["prix"])
+
+    dataset.append(second[["region", "ventes"]].assign(prix=np.nan))
+    assert dataset.get_chart("ventes")[1] is False
+    assert dataset.get_chart("prix")[1] is True
+    assert dataset.stale_charts() == 1
+
+
+def test_append_new_column_changes_schema(frames):
+    """Test qu'une nouvelle colonne est detectee comme changement de schema."""
+    first, second = frames
+    dataset = Dataset("d", first)
+    change = dataset.append(second.assign(remise=1.5))
+    assert change["schema_changed"] is True
+    assert "remise" in dataset.summary_stats()["numeric_stats"]
+
+
+def test_referenced_columns_uses_ast():
+    """Test que les colonnes citees dans le code sont extraites via l'AST."""
+    code = "agg = df.groupby('region')['ventes'].sum()\nplt.title('prix')"
+    assert referenced_columns(code, ["region", "ventes", "autre"]) == ["region", "ventes"]
+    assert referenced_columns("def (", ["region"]) == []
+
+
+@pytest.mark.parametrize("engine", ["pandas"] + (["pyarrow"] if HAS_PYARROW else []))
+def test_append_blank_cells_keep_column_types(engine):
+    """Test qu'une colonne vide dans le lot ajoute ne change ni la nature ni le type des colonnes."""
+    dataset = Dataset("d", read_csv("region,ventes,prix\nR1,3,2.5\nR2,4,1.5\n", engine=engine))
+    change = dataset.append(read_csv("region,ventes,prix\nR1,,2.5\n,5,1.0\n", engine=engine))
+    assert change["schema_changed"] is False
+    assert change["appended"] == 2
+    assert dataset.frame()["ventes"].dtype == "float64"
+    assert dataset.stats.numeric_stats()["ventes"]["max"] == 5.0
+    assert set(dataset.stats.category_counts()["region"]) == {"R1", "R2"}
+
+    change = dataset.append(read_csv("region,ventes,prix\n,,1.0\n", engine=engine))
+    assert change["schema_changed"] is False
+    assert column_kind(dataset.frame()["region"]) == "text"
+
+
+def test_mergeable_stats_stop_counting_high_cardinality_columns():
+    """Test qu'une colonne d'identifiants n'est plus comptee au-dela du seuil de cardinalite."""
+    stats = MergeableStats()
+    stats.update(pd.DataFrame({"id": [f"id{i}" for i in range(600)], "region": ["Nord", "Sud"] * 300}))
+    assert "id" in stats.category_counts()
+    stats.update(pd.DataFrame({"id": [f"id{i}" for i in range(600, 1200)], "region": ["Est"] * 600}))
+    assert "id" not in stats.categories
+    assert stats.category_counts()["region"] == {"Est": 600, "Nord": 300, "Sud": 300}
+    stats.update(pd.DataFrame({"id": ["x"], "region": ["Nord"]}))
+    assert "id" not in stats.categories
+
+
+def test_chart_key_depends_on_render_mode():
+    """Test que la cle de cache distingue les modes de rendu."""
+    proposal = {"title": "T", "chart_type": "bar", "variables": ["a"]}
+    assert chart_key(proposal, "image") != chart_key(proposal, "plotly")
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_reuses_chart_until_its_columns_change(frames):
+    """Test que le graphique est servi depuis le cache puis recalcule apres ajout."""
+    from dataviz_backend.orchestrator import MultiAgentOrchestrator
+
+    first, second = frames
+    orchestrator = MultiAgentOrchestrator()
+    dataset = Dataset("d", first)
+    dataset.summaries["probleme"] = {"insights": "LLM", **dataset.summary_stats()}
+    orchestrator.datasets.put(dataset)
+    proposal = {"title": "Ventes", "chart_type": "bar", "variables": ["region", "ventes"]}
+
+    chart = await orchestrator.generate_viz(proposal, render_mode="plotly", dataset_id="d")
+    assert await orchestrator.generate_viz(proposal, render_mode="plotly", dataset_id="d") is chart
+
+    csv_batch = second.to_csv(index=False)
+    result = await orchestrator.append_rows("d", csv_batch)
+    assert result["rows"] == 400
+    assert result["stale_charts"] == 1
+    assert result["summaries_refreshed"] == 1
+    assert result["data_summaries"]["probleme"]["insights"] == "LLM"
+    assert result["data_summaries"]["probleme"]["rows"] == 400
+
+    refreshed = await orchestrator.generate_viz(proposal, render_mode="plotly", dataset_id="d")
+    assert refreshed is not chart
+    assert sum(refreshed["plotly_json"]["data"][0]["y"]) > sum(chart["plotly_json"]["data"][0]["y"])
+
+
+@pytest.mark.asyncio
+async def test_each_analysis_gets_its_own_dataset(frames, monkeypatch):
+    """Test que deux envois du meme CSV ne partagent pas le dataset (les ajouts de l'un n'affectent pas l'autre)."""
+    from dataviz_backend.orchestrator import MultiAgentOrchestrator
+
+    orchestrator = MultiAgentOrchestrator()
+
+    async def summarize(dataset, problem, deadline=None):
+        return dataset.summary_stats()
+
+    async def propose(data_summary, problem, deadline=None):
+        return []
+
+    monkeypatch.setattr(orchestrator, "_summarize", summarize)
+    monkeypatch.setattr(orchestrator.viz_strategist, "propose_visualizations", propose)
+
+    first, second = frames
+    csv_data = first.to_csv(index=False)
+    a = await orchestrator.get_proposals("probleme", csv_data)
+    b = await orchestrator.get_proposals("probleme", csv_data)
+    assert a["dataset_id"] != b["dataset_id"]
+
+    await orchestrator.append_rows(a["dataset_id"], second.to_csv(index=False))
+    assert orchestrator.datasets.get(a["dataset_id"]).rows == 400
+    assert orchestrator.datasets.get(b["dataset_id"]).rows == 300
+
+
+def test_dataset_store_evicts_least_recently_used():
+    """Test que le store expose ses octets et evince le dataset le moins recemment utilise."""
+    store = DatasetStore(max_bytes=10**9)
+    first = Dataset("a", pd.DataFrame({"x": range(100)}))
+    second = Dataset("b", pd.DataFrame({"x": range(100)}))
+    store.put(first)
+    store.put(second)
+    store.get("a")
+    assert store.nbytes == first.nbytes + second.nbytes
+    assert store.evict_oldest() == second.nbytes
+    assert store.get("b") is None and store.get("a") is first
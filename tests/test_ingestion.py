@@ -0,0 +1,128 @@
+"""Tests pour l'ingestion CSV (sniffing + moteurs de parsing)."""
+import pytest
+import pandas as pd
+from dataviz_backend.compaction import HAS_PYARROW
+from dataviz_backend.ingestion import decode_csv, detect_encoding, sniff_csv, read_csv
+
+
+EUROPEAN_CSV = (
+    "date;région;montant\n"
+    "15/01/2024;Île-de-France;12,5\n"
+    "16/01/2024;Nord;3,25\n"
+    "17/01/2024;Sud;7,0\n"
+)
+
+
+def test_detect_encoding_utf8():
+    """Test que l'UTF-8 est detecte."""
+    assert detect_encoding("région".encode("utf-8")) == "utf-8"
+
+
+def test_detect_encoding_utf8_bom():
+    """Test que le BOM UTF-8 est detecte."""
+    assert detect_encoding(b"\xef\xbb\xbfa,b\n1,2") == "utf-8-sig"
+
+
+def test_decode_csv_windows_1252():
+    """Test qu'un fichier Windows-1252 est decode sans erreur."""
+    text, encoding = decode_csv(EUROPEAN_CSV.encode("cp1252"))
+    assert encoding == "cp1252"
+    assert "Île-de-France" in text
+
+
+def test_sniff_european_dialect():
+    """Test la detection du separateur ';' et de la virgule decimale."""
+    dialect = sniff_csv(EUROPEAN_CSV)
+    assert dialect["delimiter"] == ";"
+    assert dialect["decimal"] == ","
+    assert dialect["has_header"] is True
+    assert dialect["date_columns"] == ["date"]
+    assert dialect["dayfirst"] is True
+
+
+def test_sniff_standard_dialect():
+    """Test qu'un CSV standard garde ',' et '.'."""
+    with open("tests/test2.csv", encoding="utf-8") as f:
+        dialect = sniff_csv(f.read())
+    assert dialect["delimiter"] == ","
+    assert dialect["decimal"] == "."
+    assert "date" in dialect["date_columns"]
+
+
+def test_sniff_without_header():
+    """Test qu'une premiere ligne numerique n'est pas un en-tete."""
+    assert sniff_csv("1,2\n3,4\n")["has_header"] is False
+
+
+def test_sniff_numeric_header_cells():
+    """Test qu'un en-tete avec des annees reste un en-tete."""
+    assert sniff_csv("pays,2023,2024\nFrance,1.2,3.4\nItalie,2.5,0.7\n")["has_header"] is True
+    assert sniff_csv("pays,2023,2024\nFrance,68000000,68100000\n")["has_header"] is True
+    assert sniff_csv("France,1.2,3.4\nItalie,2.5,0.7\n")["has_header"] is False
+
+
+def test_sniff_dayfirst_ignores_non_dates():
+    """Test qu'une valeur hors format dans une colonne de dates ne fait pas echouer le sniffing."""
+    rows = "\n".join(f"{d:02d}/01/2024,{d}" for d in range(1, 29))
+    dialect = sniff_csv("date,valeur\ninconnu,0\n" + rows + "\n")
+    assert dialect["date_columns"] == ["date"]
+    assert dialect["dayfirst"] is True
+
+
+@pytest.mark.skipif(not HAS_PYARROW, reason="pyarrow non installe")
+def test_read_csv_pyarrow_empty_strings_are_null():
+    """Test que pyarrow lit les chaines vides comme des valeurs manquantes, comme pandas."""
+    csv_data = "nom,valeur\nA,1\n,2\nC,3\n"
+    assert read_csv(csv_data, engine="pyarrow")["nom"].isna().tolist() == [False, True, False]
+    assert read_csv(csv_data, engine="pandas")["nom"].isna().tolist() == [False, True, False]
+
+
+@pytest.mark.skipif(not HAS_PYARROW, reason="pyarrow non installe")
+def test_read_csv_engines_agree_on_empty_column_dtype():
+    """Test qu'une colonne sans valeur a le meme type (float64 NaN) avec les deux moteurs."""
+    csv_data = "d,v,t\n,1,a\n,2,b\n"
+    pandas_df = read_csv(csv_data, engine="pandas")
+    arrow_df = read_csv(csv_data, engine="pyarrow")
+    assert arrow_df.dtypes.to_dict() == pandas_df.dtypes.to_dict()
+    assert arrow_df["d"].dtype == "float64"
+
+
+@pytest.mark.parametrize("engine", ["pandas", pytest.param("pyarrow", marks=pytest.mark.skipif(
+    not HAS_PYARROW, reason="pyarrow non installe"))])
+def test_read_csv_engines_parse_european_csv(engine):
+    """Test que chaque moteur parse le CSV europeen en colonnes typees."""
+    df = read_csv(EUROPEAN_CSV, engine=engine)
+    assert list(df.columns) == ["date", "région", "montant"]
+    assert pd.api.types.is_datetime64_any_dtype(df["date"])
+    assert df["date"].iloc[0] == pd.Timestamp("2024-01-15")
+    assert df["montant"].tolist() == [12.5, 3.25, 7.0]
+
+
+def test_read_csv_names_headerless_columns():
+    """Test que les colonnes sans en-tete sont nommees."""
+    df = read_csv("1,2\n3,4\n")
+    assert list(df.columns) == ["colonne_1", "colonne_2"]
+    assert len(df) == 2
+
+
+@pytest.mark.parametrize("engine", ["pandas"] + (["pyarrow"] if HAS_PYARROW else []))
+def test_read_csv_projects_columns(engine):
+    """Test que usecols ne lit que les colonnes demandees, dans l'ordre du fichier."""
+    df = read_csv(EUROPEAN_CSV, engine=engine, usecols=["montant", "date"])
+    assert list(df.columns) == ["date", "montant"]
+    assert df["montant"].tolist() == [12.5, 3.25, 7.0]
+    assert pd.api.types.is_datetime64_any_dtype(df["date"])
+
+
+@pytest.mark.parametrize("engine", ["pandas"] + (["pyarrow"] if HAS_PYARROW else []))
+def test_read_csv_projects_headerless_columns(engine):
+    """Test que la projection garde les noms colonne_N d'origine sans en-tete."""
+    df = read_csv("1,2,3\n4,5,6\n", engine=engine, usecols=["colonne_3"])
+    assert list(df.columns) == ["colonne_3"]
+    assert df["colonne_3"].tolist() == [3, 6]
+
+
+def test_read_csv_unknown_column_reads_everything():
+    """Test qu'une colonne inconnue desactive la projection au lieu d'echouer."""
+    df = read_csv(EUROPEAN_CSV, usecols=["inexistante"])
+    assert list(df.columns) == ["date", "région", "montant"]
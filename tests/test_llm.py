@@ -0,0 +1,136 @@
+"""Tests pour les echeances de requete et les requetes LLM dupliquees."""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from dataviz_backend.agents.code_generator import CodeGeneratorAgent
+from dataviz_backend.agents.viz_strategist import VizStrategistAgent
+from dataviz_backend.llm import Deadline, DeadlineExceeded, hedged_create, llm_latency, llm_metrics, track_usage
+
+
+def reply(text="ok"):
+    return SimpleNamespace(content=[SimpleNamespace(text=text)])
+
+
+def fake_client(delays):
+    """Client dont le n-ieme appel repond apres delays[n] secondes"""
+    calls = []
+
+    def create(**kwargs):
+        n = len(calls)
+        calls.append(kwargs)
+        time.sleep(delays[min(n, len(delays) - 1)])
+        return reply(f"appel {n}")
+
+    return SimpleNamespace(messages=SimpleNamespace(create=create)), calls
+
+
+@pytest.fixture(autouse=True)
+def reset_counters(monkeypatch):
+    monkeypatch.setenv("LLM_HEDGE_DEFAULT_SECONDS", "0.05")
+    llm_metrics.reset()
+    llm_latency.reset()
+    yield
+    llm_latency.reset()
+
+
+@pytest.mark.asyncio
+async def test_hedged_request_wins_over_slow_original():
+    """Test qu'une requete dupliquee part au percentile et que la premiere reponse gagne."""
+    client, calls = fake_client([0.5, 0.0])
+    start = time.perf_counter()
+    response = await hedged_create(client, "test", Deadline(5))
+
+    assert time.perf_counter() - start < 0.4
+    assert response.content[0].text == "appel 1"
+    assert len(calls) == 2
+    stats = llm_metrics.snapshot()["agents"]["test"]
+    assert stats["hedged_calls"] == 1 and stats["hedge_wins"] == 1
+
+
+@pytest.mark.asyncio
+async def test_no_hedge_when_disabled(monkeypatch):
+    """Test que LLM_HEDGE_PERCENTILE=0 desactive la duplication."""
+    monkeypatch.setenv("LLM_HEDGE_PERCENTILE", "0")
+    client, calls = fake_client([0.1])
+    await hedged_create(client, "test", Deadline(5))
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_no_hedge_for_batch_deadline():
+    """Test qu'une echeance sans duplication (traitement par lots) n'envoie qu'une requete, sans timeout."""
+    client, calls = fake_client([0.2])
+    await hedged_create(client, "test", Deadline(None, hedge=False))
+    assert len(calls) == 1
+    assert "timeout" not in calls[0]
+
+
+@pytest.mark.asyncio
+async def test_track_usage_is_per_task():
+    """Test que l'usage est compte par tache, meme quand des taches tournent en parallele."""
+    def client_with_usage(tokens):
+        def create(**kwargs):
+            time.sleep(0.05)
+            return SimpleNamespace(content=[SimpleNamespace(text="ok")],
+                                   usage=SimpleNamespace(input_tokens=tokens, output_tokens=1))
+        return SimpleNamespace(messages=SimpleNamespace(create=create))
+
+    async def job(tokens):
+        with track_usage() as usage:
+            await hedged_create(client_with_usage(tokens), "test", Deadline(None, hedge=False))
+            await hedged_create(client_with_usage(tokens), "test", Deadline(None, hedge=False))
+        return usage["input_tokens"]
+
+    assert await asyncio.gather(job(10), job(1000)) == [20, 2000]
+
+
+@pytest.mark.asyncio
+async def test_deadline_bounds_latency():
+    """Test que l'echeance borne l'attente meme si le fournisseur ne repond pas."""
+    client, calls = fake_client([1.0])
+    start = time.perf_counter()
+    with pytest.raises(DeadlineExceeded):
+        await hedged_create(client, "test", Deadline(1.2))
+    assert time.perf_counter() - start < 0.6
+    assert calls[0]["timeout"] <= 0.2
+
+
+def test_deadline_from_env(monkeypatch):
+    """Test que REQUEST_DEADLINE_SECONDS=0 supprime l'echeance."""
+    monkeypatch.setenv("REQUEST_DEADLINE_SECONDS", "0")
+    assert Deadline.from_env().remaining() == float("inf")
+    monkeypatch.setenv("REQUEST_DEADLINE_SECONDS", "10")
+    assert 9 < Deadline.from_env().remaining() <= 10
+
+
+@pytest.mark.asyncio
+async def test_code_generator_falls_back_without_budget():
+    """Test que l'Agent 3 passe directement au fallback si le budget ne couvre pas un appel."""
+    agent = CodeGeneratorAgent()
+    agent.client, calls = fake_client([0.0])
+    proposal = {"title": "Ventes", "chart_type": "bar", "variables": ["produit", "ventes"]}
+
+    result = await agent.generate_visualization(proposal, "produit,ventes\nA,1\nB,2\n", Deadline(2))
+
+    assert calls == []
+    assert result["degraded"] is True
+    assert result["code"].startswith("# Fallback")
+    assert len(result["image_base64"]) > 1000
+    assert llm_metrics.snapshot()["agents"]["code_generator"]["deadline_fallbacks"] == 1
+
+
+@pytest.mark.asyncio
+async def test_viz_strategist_uses_heuristics_without_budget():
+    """Test que l'Agent 2 renvoie les propositions heuristiques si l'echeance est proche."""
+    agent = VizStrategistAgent()
+    agent.client, calls = fake_client([0.0])
+    summary = {"column_types": {"produit": "str", "ventes": "int64"}, "relevant_columns": ["produit", "ventes"]}
+
+    proposals = await agent.propose_visualizations(summary, "Ventes par produit", Deadline(0.5))
+
+    assert calls == []
+    assert [p["chart_type"] for p in proposals] == ["bar", "scatter", "pie"]
+    assert proposals[0]["variables"] == ["produit", "ventes"]
@@ -0,0 +1,112 @@
+"""Tests pour le gouverneur de budget memoire."""
+import asyncio
+import pytest
+from dataviz_backend.memory import MemoryBudgetExceeded, MemoryGovernor, estimate_footprint
+
+
+def test_estimate_footprint_scales_with_size():
+    """Test que l'estimation croit avec la taille du CSV."""
+    small = "a,b\n" + "1,x\n" * 100
+    large = "a,b\n" + "1,x\n" * 10000
+    assert estimate_footprint(small) > len(small)
+    assert estimate_footprint(large) > 50 * estimate_footprint(small)
+
+
+@pytest.mark.asyncio
+async def test_reserve_and_release():
+    """Test que la reservation est liberee en sortie de contexte."""
+    governor = MemoryGovernor(budget_bytes=1000)
+    async with governor.reserve(600):
+        assert governor.reserved_bytes == 600
+    assert governor.reserved_bytes == 0
+
+
+@pytest.mark.asyncio
+async def test_reserve_rejects_oversized_request():
+    """Test qu'une requete plus grosse que le budget est rejetee."""
+    governor = MemoryGovernor(budget_bytes=1000)
+    with pytest.raises(MemoryBudgetExceeded):
+        async with governor.reserve(2000):
+            pass
+
+
+class FakeCache:
+    """Cache minimal : entrees (derniere utilisation, octets), de la plus ancienne a la plus recente"""
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+
+    @property
+    def nbytes(self):
+        return sum(size for _, size in self.entries)
+
+    def oldest_access(self):
+        return self.entries[0][0] if self.entries else None
+
+    def evict_oldest(self):
+        return self.entries.pop(0)[1]
+
+
+@pytest.mark.asyncio
+async def test_reserve_evicts_caches_when_that_is_enough():
+    """Test qu'une requete bloquee par les caches est admise apres eviction."""
+    governor = MemoryGovernor(budget_bytes=1000, wait_timeout=0.05)
+    cache = FakeCache([(1.0, 100)])
+    governor.register_cache(cache)
+
+    async with governor.reserve(800):
+        async with governor.reserve(150):
+            assert governor.reserved_bytes == 950
+    assert cache.entries == []
+    assert governor.reserved_bytes == 0
+
+
+@pytest.mark.asyncio
+async def test_cache_bytes_count_and_are_evicted_in_lru_order():
+    """Test que les caches comptent dans le budget et ne sont evinces que du necessaire, LRU d'abord."""
+    governor = MemoryGovernor(budget_bytes=1000, wait_timeout=0.05)
+    tiles = FakeCache([(1.0, 300), (4.0, 200)])
+    datasets = FakeCache([(2.0, 300), (3.0, 100)])
+    governor.register_cache(tiles)
+    governor.register_cache(datasets)
+    assert governor.available_bytes == 100
+
+    async with governor.reserve(600):
+        pass
+    # 1.0 puis 2.0 evinces (600 octets liberes) ; les entrees recentes restent
+    assert tiles.entries == [(4.0, 200)]
+    assert datasets.entries == [(3.0, 100)]
+
+
+@pytest.mark.asyncio
+async def test_reserve_admits_after_release():
+    """Test qu'une requete en attente passe quand le budget se libere."""
+    governor = MemoryGovernor(budget_bytes=1000, wait_timeout=1.0)
+    order = []
+
+    async def first():
+        async with governor.reserve(800):
+            await asyncio.sleep(0.05)
+            order.append("first")
+
+    async def second():
+        await asyncio.sleep(0.01)
+        async with governor.reserve(500):
+            order.append("second")
+
+    await asyncio.gather(first(), second())
+    assert order == ["first", "second"]
+
+
+@pytest.mark.asyncio
+async def test_caches_are_kept_when_reservations_block_admission():
+    """Test qu'on n'evince rien si meme des caches vides ne suffiraient pas (requetes en cours)."""
+    governor = MemoryGovernor(budget_bytes=1000, wait_timeout=0.05)
+    datasets = FakeCache([(1.0, 50), (2.0, 50)])
+    governor.register_cache(datasets)
+
+    async with governor.reserve(800):
+        with pytest.raises(MemoryBudgetExceeded):
+            async with governor.reserve(300):
+                pass
+    assert len(datasets.entries) == 2
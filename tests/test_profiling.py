@@ -0,0 +1,134 @@
+"""Tests pour le profilage opt-in (echantillonnage + tracemalloc)."""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from httpx import ASGITransport, AsyncClient
+
+from dataviz_backend.main import ProfilingMiddleware
+from dataviz_backend.profiling import PROFILE_ID_HEADER, ProfileStore, ProfilingConfig, SamplingProfiler
+
+
+def busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    data = []
+    while time.perf_counter() < end:
+        data.append(bytearray(1000))
+    return len(data)
+
+
+def profile_busy(interval=0.002):
+    profiler = SamplingProfiler(threading.get_ident(), interval=interval)
+    profiler.start()
+    busy_loop(0.1)
+    profiler.stop()
+    return profiler
+
+
+def test_sampler_records_stacks_and_peak_memory():
+    """Test que les piles echantillonnees contiennent la fonction chaude et le pic memoire."""
+    profiler = profile_busy()
+    assert profiler.samples > 3
+    assert any(frame[0] == "busy_loop" for stack in profiler.stacks for frame in stack)
+
+    summary = profiler.summary()
+    assert summary["memory"]["peak_bytes"] > 0
+    assert summary["memory"]["top_allocations"]
+    assert "busy_loop" in summary["self_time"][0]["function"]
+
+
+def test_speedscope_and_folded_formats():
+    """Test que les fichiers produits suivent les formats speedscope / piles repliees."""
+    profiler = profile_busy()
+    doc = profiler.to_speedscope("test")
+    profile = doc["profiles"][0]
+    assert profile["type"] == "sampled"
+    assert len(profile["samples"]) == len(profile["weights"])
+    n_frames = len(doc["shared"]["frames"])
+    assert all(0 <= i < n_frames for sample in profile["samples"] for i in sample)
+
+    line = profiler.to_folded().splitlines()[0]
+    stack, count = line.rsplit(" ", 1)
+    assert int(count) > 0 and ";" in stack
+
+
+def test_store_enforces_retention(tmp_path):
+    """Test que seuls les N profils les plus recents sont conserves."""
+    store = ProfileStore(str(tmp_path), retention=2)
+    profiler = profile_busy()
+    ids = [store.save(profiler, "POST /api/generate") for _ in range(4)]
+
+    assert store.profile_ids() == ids[-2:]
+    assert len(list(tmp_path.iterdir())) == 2 * len(ProfileStore.SUFFIXES)
+    with open(tmp_path / f"{ids[-1]}.summary.json", encoding="utf-8") as f:
+        assert json.load(f)["label"] == "POST /api/generate"
+
+
+def test_disabled_by_default(monkeypatch):
+    """Test que sans configuration le profilage est desactive."""
+    monkeypatch.delenv("PROFILE_TOKEN", raising=False)
+    monkeypatch.delenv("PROFILE_ALL", raising=False)
+    assert not ProfilingConfig.from_env().enabled
+
+
+def test_wants_handles_non_ascii_header(tmp_path):
+    """Test qu'un en-tete non ASCII est refuse au lieu de lever TypeError."""
+    config = ProfilingConfig(token="secret", directory=str(tmp_path))
+    assert config.wants("secret")
+    assert not config.wants("sécret")
+    assert not config.wants(None)
+
+
+def test_middleware_profiles_only_with_admin_header(tmp_path):
+    """Test que seules les requetes portant le bon jeton sont profilees."""
+    app = FastAPI()
+
+    @app.post("/api/work")
+    async def work():
+        return {"n": busy_loop(0.05)}
+
+    config = ProfilingConfig(token="secret", directory=str(tmp_path), interval=0.002)
+    app.add_middleware(ProfilingMiddleware, config=config)
+    client = TestClient(app)
+
+    assert PROFILE_ID_HEADER not in client.post("/api/work").headers
+    assert PROFILE_ID_HEADER not in client.post("/api/work", headers={"X-Profile": "wrong"}).headers
+
+    response = client.post("/api/work", headers={"X-Profile": "secret"})
+    assert response.status_code == 200
+    profile_id = response.headers[PROFILE_ID_HEADER]
+    assert config.store.profile_ids() == [profile_id]
+    assert (tmp_path / f"{profile_id}.speedscope.json").exists()
+
+
+@pytest.mark.asyncio
+async def test_summary_reports_concurrent_requests(tmp_path):
+    """Test que le profil indique les requetes concurrentes dont les piles s'y melangent."""
+    app = FastAPI()
+
+    @app.post("/api/work")
+    async def work():
+        await asyncio.sleep(0.1)
+        return {"ok": True}
+
+    config = ProfilingConfig(token="secret", directory=str(tmp_path), interval=0.002, trace_memory=False)
+    app.add_middleware(ProfilingMiddleware, config=config)
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        alone = await client.post("/api/work", headers={"X-Profile": "secret"})
+        shared, _ = await asyncio.gather(
+            client.post("/api/work", headers={"X-Profile": "secret"}),
+            client.post("/api/work"),
+        )
+
+    def summary(response):
+        profile_id = response.headers[PROFILE_ID_HEADER]
+        return json.loads((tmp_path / f"{profile_id}.summary.json").read_text())
+
+    assert summary(alone)["concurrent_requests"] == 1
+    assert summary(shared)["concurrent_requests"] == 2
+    assert config.in_flight == 0
@@ -0,0 +1,88 @@
+"""Tests pour la projection de colonnes (seules les colonnes utiles sont lues et rendues)."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataviz_backend.agents.data_analyst import DataAnalystAgent
+from dataviz_backend.datasets import MergeableStats
+from dataviz_backend.projection import chart_columns, column_share
+
+COLUMNS = ["date", "region", "ventes", "prix", "stock"]
+
+
+def wide_frame(n_cols=200, n_rows=50):
+    rng = np.random.default_rng(0)
+    data = {"region": ["Nord", "Sud"] * (n_rows // 2)}
+    data.update({f"mesure_{i}": rng.normal(size=n_rows) for i in range(1, n_cols)})
+    return pd.DataFrame(data)
+
+
+def test_chart_columns_keeps_variables_in_dataset_order():
+    """Test que la projection suit l'ordre du dataset."""
+    proposal = {"variables": ["ventes", "region"]}
+    assert chart_columns(proposal, COLUMNS) == ["region", "ventes"]
+
+
+def test_chart_columns_adds_columns_referenced_in_code():
+    """Test que les colonnes citees dans le code genere sont conservees (AST)."""
+    proposal = {"variables": ["region", "ventes"]}
+    code = "df.groupby('region')['ventes'].sum()\nplt.title(df['prix'].name)"
+    assert chart_columns(proposal, COLUMNS, code) == ["region", "ventes", "prix"]
+
+
+def test_chart_columns_disabled_on_unknown_variable():
+    """Test qu'une variable inconnue desactive la projection (l'agent voit tout)."""
+    assert chart_columns({"variables": ["region", "Ventes"]}, COLUMNS) is None
+    assert chart_columns({"variables": []}, COLUMNS) is None
+
+
+def test_column_share():
+    """Test la fraction de colonnes utilisee pour estimer la memoire."""
+    assert column_share(["region", "ventes"], COLUMNS) == pytest.approx(0.4)
+    assert column_share(None, COLUMNS) == 1.0
+    assert column_share(["inexistante"], COLUMNS) == 1.0
+
+
+def test_mergeable_stats_ignore_columns_beyond_limits():
+    """Test que les statistiques ne lisent que les colonnes profilees."""
+    stats = MergeableStats()
+    stats.update(wide_frame())
+    assert len(stats.numeric) == 10
+    assert len(stats.corr_columns) == 8
+
+
+@pytest.mark.asyncio
+async def test_analyst_profiles_only_limited_columns():
+    """Test que l'Agent 1 ne compacte que les colonnes profilees mais type toutes les colonnes."""
+    from types import SimpleNamespace
+
+    agent = DataAnalystAgent()
+    agent.client = SimpleNamespace(messages=SimpleNamespace(
+        create=lambda **kwargs: SimpleNamespace(content=[SimpleNamespace(text='{"insights": "ok"}')])
+    ))
+    df = wide_frame()
+    result = await agent.analyze_dataframe(df, "Mesures par region")
+
+    assert len(result["column_types"]) == 200
+    assert len(result["numeric_stats"]) == 10
+    assert result["memory"]["before_bytes"] < df.memory_usage(deep=True).sum() / 10
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_reads_only_chart_columns():
+    """Test que la generation depuis un CSV ne parse que les colonnes du graphique."""
+    from dataviz_backend.orchestrator import MultiAgentOrchestrator
+
+    orchestrator = MultiAgentOrchestrator()
+    seen = {}
+
+    async def fake_render(proposal, df, render_mode, deadline=None):
+        seen["columns"] = list(df.columns)
+        return {"code": "", "plotly_json": {}}
+
+    orchestrator._render = fake_render
+    csv_data = wide_frame().to_csv(index=False)
+    proposal = {"title": "T", "chart_type": "bar", "variables": ["mesure_3", "region"]}
+    await orchestrator.generate_viz(proposal, csv_data, render_mode="plotly")
+
+    assert seen["columns"] == ["region", "mesure_3"]
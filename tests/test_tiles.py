@@ -0,0 +1,62 @@
+"""Tests pour la pyramide de tuiles."""
+import numpy as np
+import pandas as pd
+import pytest
+from dataviz_backend.tiles import TILE_SIZE, TileCache, TilePyramid, bin_points
+
+
+def test_bin_points_keeps_every_point():
+    """Test que le binning agrege tous les points, sans echantillonnage."""
+    x = np.array([0.0, 0.0, 1.0, 0.5])
+    y = np.array([0.0, 0.0, 1.0, 0.5])
+    grid = bin_points(x, y, (0.0, 1.0, 0.0, 1.0), size=4)
+    assert grid.sum() == 4
+    assert grid[3, 0] == 2  # (0, 0) en bas a gauche
+    assert grid[0, 3] == 1  # (1, 1) en haut a droite
+
+
+def test_pyramid_levels_preserve_counts():
+    """Test que chaque niveau de zoom contient le meme nombre de points."""
+    rng = np.random.default_rng(0)
+    pyramid = TilePyramid(rng.normal(size=5000), rng.normal(size=5000), max_zoom=2)
+    assert pyramid.levels[0][0].shape == (TILE_SIZE, TILE_SIZE)
+    assert pyramid.levels[2][0].shape == (4 * TILE_SIZE, 4 * TILE_SIZE)
+    assert all(level[0].sum() == 5000 for level in pyramid.levels)
+
+
+def test_render_tile_returns_png():
+    """Test que render_tile retourne un PNG."""
+    rng = np.random.default_rng(0)
+    pyramid = TilePyramid(rng.normal(size=1000), rng.normal(size=1000), values=rng.normal(size=1000), max_zoom=1)
+    png = pyramid.render_tile(1, 0, 1)
+    assert png.startswith(b"\x89PNG")
+    assert pyramid.has_tile(1, 1, 1)
+    assert not pyramid.has_tile(2, 0, 0)
+
+
+def test_from_dataframe_rejects_text_column():
+    """Test qu'une colonne texte est refusee."""
+    df = pd.DataFrame({"x": [1, 2], "nom": ["a", "b"]})
+    with pytest.raises(ValueError, match="numerique"):
+        TilePyramid.from_dataframe(df, "x", "nom")
+
+
+def test_from_dataframe_drops_missing_dates():
+    """Test qu'une date manquante (NaT) est ignoree au lieu d'etirer l'axe jusqu'a l'an -292 milliards."""
+    df = pd.DataFrame({
+        "date": pd.to_datetime(["2024-01-01", None, "2024-01-03"]),
+        "valeur": [1.0, 2.0, 3.0],
+    })
+    pyramid = TilePyramid.from_dataframe(df, "date", "valeur")
+    assert pyramid.levels[-1][0].sum() == 2
+    assert pyramid.bounds[0] > pd.Timestamp("2023-12-31").timestamp()
+
+
+def test_tile_cache_evicts_least_recently_used():
+    """Test que le cache evince la pyramide la moins recemment utilisee."""
+    pyramid = TilePyramid(np.arange(10.0), np.arange(10.0), max_zoom=0)
+    cache = TileCache(max_bytes=int(pyramid.nbytes * 1.5))
+    cache.put("a", pyramid)
+    cache.put("b", pyramid)
+    assert cache.get("a") is None
+    assert cache.get("b") is pyramid